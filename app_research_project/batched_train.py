@@ -0,0 +1,273 @@
+"""my-awesome-app: Train the models of many simulated clients at once with `torch.func`."""
+
+import time
+
+import torch
+import torch.nn.functional as F
+from flwr.common import (
+    Code,
+    Context,
+    EvaluateRes,
+    FitRes,
+    RecordDict,
+    Status,
+    ndarrays_to_parameters,
+    parameters_to_ndarrays,
+)
+from flwr.server import SimpleClientManager
+from flwr.server.client_proxy import ClientProxy
+from torch.func import functional_call, grad_and_value, vmap
+
+from app_research_project.client_app import build_fit_metrics
+from app_research_project.compression import UpdateCodec
+from app_research_project.metrics_log import MetricsLogger, client_log_name, get_run_dir
+from app_research_project.partitioning import Partitioning
+from app_research_project.server_app import server_fn
+from app_research_project.task import Net, load_data, set_weights, test
+from app_research_project.timing import activate, span
+
+# Upper bound of the clients trained together, to bound the memory of a step
+MAX_STACKED_CLIENTS = 64
+
+# Defaults of `torch.optim.Adam`, which `train` uses
+BETAS = (0.9, 0.999)
+EPS = 1e-8
+
+
+def train_stacked(net, parameters, trainloaders, epochs, lr, device):
+    """Train one copy of `net` per trainloader, all of them at the same time.
+
+    Every copy starts from the same `parameters` (as NumPy arrays, in `get_weights`
+    order). The parameters of the K copies are stacked along a new first dimension and
+    each step computes the gradients of all of them in a single `vmap`-ed call, followed
+    by a stacked Adam update. Each client sees the same batches, in the same order, as
+    `train` would draw from its trainloader; clients with fewer batches are masked out
+    of the remaining steps. Returns the weights and the average train loss of each client.
+    """
+    net.to(device)
+    names = list(net.state_dict().keys())
+    num_clients = len(trainloaders)
+    params = {
+        name: torch.as_tensor(array, device=device).expand(num_clients, *array.shape).clone()
+        for name, array in zip(names, parameters)
+    }
+    exp_avg = {name: torch.zeros_like(p) for name, p in params.items()}
+    exp_avg_sq = {name: torch.zeros_like(p) for name, p in params.items()}
+    steps = torch.zeros(num_clients, device=device)
+    running_loss = torch.zeros(num_clients, device=device)
+
+    def loss_fn(client_params, images, labels, mask):
+        outputs = functional_call(net, client_params, (images,))
+        losses = F.cross_entropy(outputs, labels, reduction="none")
+        # Mean over the real examples of the (padded) batch, like `train`
+        return (losses * mask).sum() / mask.sum().clamp(min=1)
+
+    step_fn = vmap(grad_and_value(loss_fn))
+    batch_size = max(loader.batch_size for loader in trainloaders)
+
+    for _ in range(epochs):
+        iterators = [iter(loader) for loader in trainloaders]
+        while True:
+            batches = [next(iterator, None) for iterator in iterators]
+            if all(batch is None for batch in batches):
+                break
+            sample = next(batch for batch in batches if batch is not None)["image"]
+            images = torch.zeros(num_clients, batch_size, *sample.shape[1:], device=device)
+            labels = torch.zeros(num_clients, batch_size, dtype=torch.long, device=device)
+            mask = torch.zeros(num_clients, batch_size, device=device)
+            for i, batch in enumerate(batches):
+                if batch is not None:
+                    size = len(batch["label"])
+                    images[i, :size] = batch["image"]
+                    labels[i, :size] = batch["label"]
+                    mask[i, :size] = 1.0
+
+            grads, losses = step_fn(params, images, labels, mask)
+            live = mask.sum(1) > 0
+            steps += live
+            running_loss += losses.detach() * live
+
+            # Adam update of the clients that had a batch in this step
+            bias_correction1 = 1 - BETAS[0] ** steps.clamp(min=1)
+            bias_correction2 = 1 - BETAS[1] ** steps.clamp(min=1)
+            with torch.no_grad():
+                for name, p in params.items():
+                    shape = (num_clients,) + (1,) * (p.dim() - 1)
+                    update = live.view(shape)
+                    grad = grads[name]
+                    exp_avg[name] = torch.where(
+                        update, BETAS[0] * exp_avg[name] + (1 - BETAS[0]) * grad, exp_avg[name]
+                    )
+                    exp_avg_sq[name] = torch.where(
+                        update,
+                        BETAS[1] * exp_avg_sq[name] + (1 - BETAS[1]) * grad * grad,
+                        exp_avg_sq[name],
+                    )
+                    denom = exp_avg_sq[name].sqrt() / bias_correction2.sqrt().view(shape) + EPS
+                    step_size = lr / bias_correction1.view(shape)
+                    params[name] = torch.where(update, p - step_size * exp_avg[name] / denom, p)
+
+    num_batches = torch.tensor([max(len(loader), 1) for loader in trainloaders], device=device)
+    avg_trainloss = (running_loss / num_batches).tolist()
+    weights = [[params[name][i].cpu().numpy() for name in names] for i in range(num_clients)]
+    return weights, avg_trainloss
+
+
+class PartitionProxy(ClientProxy):
+    """Stand-in for the `ClientProxy` of a simulated SuperNode.
+
+    The stacked engine trains and evaluates the clients itself, so the strategy only
+    uses these proxies to sample clients and to pair them with their results.
+    """
+
+    def __init__(self, partition_id: int):
+        super().__init__(cid=str(partition_id))
+        self.partition_id = partition_id
+
+    def get_properties(self, ins, timeout, group_id):
+        raise NotImplementedError
+
+    def get_parameters(self, ins, timeout, group_id):
+        raise NotImplementedError
+
+    def fit(self, ins, timeout, group_id):
+        raise NotImplementedError
+
+    def evaluate(self, ins, timeout, group_id):
+        raise NotImplementedError
+
+    def reconnect(self, ins, timeout, group_id):
+        raise NotImplementedError
+
+
+def run_stacked_simulation(run_config: dict, num_supernodes: int, device="cpu") -> None:
+    """Run the ServerApp of this app with all ClientApps trained by `train_stacked`.
+
+    The rounds follow those of the Flower `Server`: the same strategy samples the
+    clients, aggregates their updates and evaluates the global model. Only the local
+    training of the sampled clients is replaced, by stacked training in this process.
+    The records of the ServerApp and ClientApps are written to the usual run directory.
+    """
+    if run_config["aggregation"] != "sync":
+        raise ValueError("The stacked engine only runs synchronous rounds (aggregation = 'sync')")
+    if run_config["round-deadline"] or run_config["oversample"] != 1.0:
+        raise ValueError("The stacked engine trains all sampled clients, it has no round deadline")
+    if run_config["client-optimizer-state"]:
+        raise ValueError("The stacked engine creates new optimizers every round (client-optimizer-state = false)")
+    if any(run_config[key] for key in ("bf16-autocast", "channels-last", "torch-compile", "fused-optimizer")):
+        raise ValueError(
+            "The stacked engine trains in float32 with its own Adam "
+            "(no bf16-autocast, channels-last, torch-compile or fused-optimizer)"
+        )
+    context = Context(
+        run_id=0, node_id=0, node_config={}, state=RecordDict(), run_config=run_config
+    )
+    components = server_fn(context)
+    strategy = components.strategy
+    num_rounds = components.config.num_rounds
+    local_epochs = run_config["local-epochs"]
+    run_dir = get_run_dir(context)
+
+    client_manager = SimpleClientManager()
+    for partition_id in range(num_supernodes):
+        client_manager.register(PartitionProxy(partition_id))
+    loaders = {}  # Cache the data of each partition (trainloader, valloader)
+    loggers = {}
+    codec = UpdateCodec.from_run_config(run_config)
+    partitioning = Partitioning.from_run_config(run_config)
+    residuals = {}  # Error feedback of each client (when updates are compressed)
+
+    def client_data(partition_id):
+        if partition_id not in loaders:
+            loaders[partition_id] = load_data(partition_id, num_supernodes, partitioning)
+            loggers[partition_id] = MetricsLogger(
+                run_dir / client_log_name(partition_id), fsync=run_config["metrics-fsync"]
+            )
+        return loaders[partition_id]
+
+    net = Net()
+    ok = Status(code=Code.OK, message="")
+    try:
+        parameters = strategy.initialize_parameters(client_manager)
+        strategy.evaluate(0, parameters)
+
+        for server_round in range(1, num_rounds + 1):
+            # Train the sampled clients, stacked in chunks
+            instructions = strategy.configure_fit(server_round, parameters, client_manager)
+            fit_results = []
+            for start in range(0, len(instructions), MAX_STACKED_CLIENTS):
+                chunk = instructions[start : start + MAX_STACKED_CLIENTS]
+                trainloaders = [client_data(proxy.partition_id)[0] for proxy, _ in chunk]
+                # Same batch order as the ClientApp of the partition draws in this round
+                for trainloader in trainloaders:
+                    trainloader.reseed(server_round)
+                config = chunk[0][1].config
+                global_weights = parameters_to_ndarrays(chunk[0][1].parameters)
+                t0 = time.perf_counter()
+                with activate(strategy.tracer, round=server_round), span(
+                    "train_stacked", num_clients=len(chunk)
+                ):
+                    weights, train_losses = train_stacked(
+                        net,
+                        global_weights,
+                        trainloaders,
+                        local_epochs,
+                        config["lr"],
+                        device,
+                    )
+                # Clients of a chunk train together, each of them took the whole time
+                elapsed = time.perf_counter() - t0
+                for (proxy, _), client_weights, train_loss, trainloader in zip(
+                    chunk, weights, train_losses, trainloaders
+                ):
+                    if codec.enabled:
+                        client_weights, residuals[proxy.partition_id] = codec.encode(
+                            client_weights, global_weights, residuals.get(proxy.partition_id)
+                        )
+                    num_examples = len(trainloader.dataset)
+                    loggers[proxy.partition_id].log(
+                        event="fit",
+                        round=server_round,
+                        partition_id=proxy.partition_id,
+                        train_loss=train_loss,
+                        num_examples=num_examples,
+                    )
+                    fit_res = FitRes(
+                        ok,
+                        ndarrays_to_parameters(client_weights),
+                        num_examples,
+                        build_fit_metrics(
+                            proxy.partition_id, train_loss, num_examples * local_epochs / elapsed
+                        ),
+                    )
+                    fit_results.append((proxy, fit_res))
+            if fit_results:
+                parameters_aggregated, _ = strategy.aggregate_fit(server_round, fit_results, [])
+                if parameters_aggregated is not None:
+                    parameters = parameters_aggregated
+
+            strategy.evaluate(server_round, parameters)
+
+            # Evaluate the global model on the sampled clients
+            instructions = strategy.configure_evaluate(server_round, parameters, client_manager)
+            if not instructions:
+                continue
+            set_weights(net, parameters_to_ndarrays(parameters))
+            evaluate_results = []
+            for proxy, _ in instructions:
+                valloader = client_data(proxy.partition_id)[1]
+                loss, accuracy = test(net, valloader, device)
+                num_examples = len(valloader.dataset)
+                loggers[proxy.partition_id].log(
+                    event="evaluate",
+                    round=server_round,
+                    partition_id=proxy.partition_id,
+                    loss=loss,
+                    accuracy=accuracy,
+                    num_examples=num_examples,
+                )
+                evaluate_res = EvaluateRes(ok, loss, num_examples, {"accuracy": accuracy})
+                evaluate_results.append((proxy, evaluate_res))
+            strategy.aggregate_evaluate(server_round, evaluate_results, [])
+    finally:
+        strategy.close()
@@ -0,0 +1,123 @@
+"""my-awesome-app: A Flower `Server` that trains clients asynchronously (FedBuff)."""
+
+import concurrent.futures
+import timeit
+from logging import INFO
+
+from flwr.common import Code
+from flwr.common.logger import log
+from flwr.server import History, Server
+from flwr.server.criterion import Criterion
+from flwr.server.server import fit_client
+
+
+class Idle(Criterion):
+    """Select the clients that aren't training already."""
+
+    def __init__(self, busy: set[str]):
+        self.busy = busy
+
+    def select(self, client) -> bool:
+        return client.cid not in self.busy
+
+
+class BufferedServer(Server):
+    """Run the rounds of a `FedBuff` strategy without waiting for the slowest client.
+
+    `concurrency` clients (by default as many as `fraction-fit` samples) are training
+    at any time: whenever one returns, an idle client is sent the current global model.
+    Returned updates are buffered, and once `strategy.buffer_size` of them are in the
+    strategy updates the global model, which is then evaluated like after a round.
+    Updates arriving after the global model moved on are applied too, with a weight
+    depending on their staleness (see `FedBuff`).
+    """
+
+    def __init__(self, *, client_manager, strategy, concurrency=0):
+        super().__init__(client_manager=client_manager, strategy=strategy)
+        self.concurrency = concurrency
+
+    def dispatch(self, executor, in_flight, version, timeout) -> None:
+        """Send the global model of `version` to idle clients, up to `concurrency`."""
+        available = self._client_manager.num_available()
+        concurrency = self.concurrency or self.strategy.num_fit_clients(available)[0]
+        busy = {client.cid for client, _ in in_flight.values()}
+        num_clients = min(concurrency - len(in_flight), available - len(busy))
+        if num_clients <= 0:
+            return
+        clients = self._client_manager.sample(num_clients, criterion=Idle(busy))
+        for client, ins in self.strategy.configure_dispatch(version, self.parameters, clients):
+            future = executor.submit(fit_client, client, ins, timeout, version + 1)
+            in_flight[future] = (client, version)
+
+    def fit(self, num_rounds: int, timeout: float | None) -> tuple[History, float]:
+        """Run FedBuff until the global model has been updated `num_rounds` times."""
+        history = History()
+
+        # Initialize parameters
+        log(INFO, "[INIT]")
+        self.parameters = self._get_initial_parameters(server_round=0, timeout=timeout)
+        res = self.strategy.evaluate(0, parameters=self.parameters)
+        if res is not None:
+            history.add_loss_centralized(server_round=0, loss=res[0])
+            history.add_metrics_centralized(server_round=0, metrics=res[1])
+        self._client_manager.wait_for(self.strategy.min_available_clients)
+
+        start_time = timeit.default_timer()
+        version = 0  # Number of updates of the global model so far
+        in_flight = {}  # Future of each training client -> (client, version it trains from)
+        buffer, failures = [], []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while version < num_rounds:
+                self.dispatch(executor, in_flight, version, timeout)
+                if not in_flight:
+                    log(INFO, "dispatch: no clients available, cancel")
+                    break
+                done, _ = concurrent.futures.wait(
+                    in_flight, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    client, client_version = in_flight.pop(future)
+                    if future.exception() is not None:
+                        failures.append(future.exception())
+                        continue
+                    _, fit_res = future.result()
+                    if fit_res.status.code == Code.OK:
+                        buffer.append((client, fit_res, client_version))
+                    else:
+                        failures.append((client, fit_res))
+                if len(buffer) < self.strategy.buffer_size:
+                    continue
+
+                version += 1
+                log(INFO, "")
+                log(INFO, "[ROUND %s] aggregating %s buffered updates", version, len(buffer))
+                self.parameters, fit_metrics = self.strategy.aggregate_buffer(
+                    version, buffer, failures
+                )
+                buffer, failures = [], []
+                history.add_metrics_distributed_fit(server_round=version, metrics=fit_metrics)
+                self.strategy.forget_versions({v for _, v in in_flight.values()})
+
+                res_cen = self.strategy.evaluate(version, parameters=self.parameters)
+                if res_cen is not None:
+                    loss_cen, metrics_cen = res_cen
+                    log(
+                        INFO,
+                        "fit progress: (%s, %s, %s, %s)",
+                        version,
+                        loss_cen,
+                        metrics_cen,
+                        timeit.default_timer() - start_time,
+                    )
+                    history.add_loss_centralized(server_round=version, loss=loss_cen)
+                    history.add_metrics_centralized(server_round=version, metrics=metrics_cen)
+
+                res_fed = self.evaluate_round(server_round=version, timeout=timeout)
+                if res_fed is not None and res_fed[0] is not None:
+                    history.add_loss_distributed(server_round=version, loss=res_fed[0])
+                    history.add_metrics_distributed(server_round=version, metrics=res_fed[1])
+            # Leaving the executor waits for the clients still training; their updates
+            # arrive after the last round and are discarded
+
+        elapsed = timeit.default_timer() - start_time
+        return history, elapsed
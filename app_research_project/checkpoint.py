@@ -0,0 +1,91 @@
+"""my-awesome-app: Write model checkpoints in the background."""
+
+import atexit
+import os
+import queue
+import threading
+from logging import ERROR
+from pathlib import Path
+
+import torch
+from flwr.common.logger import log
+
+from app_research_project.timing import activate, span
+
+
+class CheckpointWriter:
+    """Save checkpoints from a background thread, off the critical path of the rounds.
+
+    `save` hands a checkpoint over to the writer thread and returns straight away, so
+    writing it overlaps with the next round. At most `max_pending` checkpoints wait in
+    the queue; past that `save` blocks until the writer catches up. Each checkpoint is
+    written to a temporary file and renamed once complete, so a crash never leaves a
+    truncated `global_model_round_<n>` behind.
+
+    Retention: with `keep_last=K` (0 keeps everything) only the K most recent
+    checkpoints are kept, plus those of every `every`-th round (if set). `close`
+    waits for pending checkpoints to be written, and is also called at exit.
+
+    With a `tracer`, writing each checkpoint is recorded as a `checkpoint_write` span.
+    """
+
+    def __init__(self, directory, keep_last=0, every=0, max_pending=2, tracer=None):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.keep_last = keep_last
+        self.every = every
+        self.tracer = tracer
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.written = []  # Rounds of the most recent checkpoints
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def path(self, server_round: int) -> Path:
+        return self.directory / f"global_model_round_{server_round}"
+
+    def save(self, server_round: int, state) -> None:
+        """Queue the checkpoint of `server_round`.
+
+        `state` is what `torch.save` receives, or a function returning it, which is then
+        called in the writer thread (e.g. to deserialize the parameters there).
+        """
+        if self.closed:
+            raise RuntimeError("The checkpoint writer is closed")
+        self.queue.put((server_round, state))
+
+    def close(self) -> None:
+        """Write all pending checkpoints and stop the writer thread."""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
+        atexit.unregister(self.close)
+
+    def _run(self):
+        while (item := self.queue.get()) is not None:
+            server_round, state = item
+            try:
+                with activate(self.tracer, round=server_round), span("checkpoint_write"):
+                    self._write(server_round, state() if callable(state) else state)
+                self._apply_retention(server_round)
+            except Exception as err:  # pylint: disable=broad-exception-caught
+                log(ERROR, "Failed to save the checkpoint of round %s: %s", server_round, err)
+
+    def _write(self, server_round, state):
+        path = self.path(server_round)
+        tmp = path.with_name(path.name + ".tmp")
+        torch.save(state, tmp)
+        os.replace(tmp, path)
+
+    def _apply_retention(self, server_round):
+        self.written.append(server_round)
+        if not self.keep_last:
+            return
+        for old_round in self.written[: -self.keep_last]:
+            # Checkpoints of every `every`-th round are kept regardless of `keep_last`
+            if not (self.every and old_round % self.every == 0):
+                self.path(old_round).unlink(missing_ok=True)
+        self.written = self.written[-self.keep_last :]
@@ -1,20 +1,70 @@
 """my-awesome-app: A Flower / PyTorch app."""
 
 import json
+import time
 from random import random
 
 import torch
 from flwr.client import ClientApp, NumPyClient
-from flwr.common import ConfigRecord, Context
-
-from app_research_project.task import Net, get_weights, load_data, set_weights, test, train
+from flwr.common import ArrayRecord, ConfigRecord, Context
+
+from app_research_project.client_cache import CLIENT_CACHE, ClientState
+from app_research_project.compression import UpdateCodec
+from app_research_project.metrics_log import MetricsLogger, client_log_name, get_run_dir
+from app_research_project.partitioning import Partitioning
+from app_research_project.task import (
+    Net,
+    TrainOptions,
+    get_weights,
+    load_data,
+    set_weights,
+    test,
+    train,
+)
+from app_research_project.timing import Tracer, activate, span
 import os
 os.environ["USE_TF"] = "0"
 os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
 
 
+def parse_latency(spec: str) -> dict[int, float]:
+    """Parse the `simulated-latency` entry of the run config.
+
+    e.g. `"0:5,3:1.5"` delays the updates of partition 0 by 5 seconds and those of
+    partition 3 by 1.5 seconds. Other partitions reply as soon as they are done.
+    """
+    latency = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        partition_id, seconds = item.split(":")
+        latency[int(partition_id)] = float(seconds)
+    return latency
+
+
+def build_fit_metrics(partition_id: int, train_loss: float, throughput: float) -> dict:
+    """Metrics a ClientApp sends along with its locally-updated model.
+
+    `partition_id` tells the server which partition the client holds (it only knows
+    the clients by their node id). `throughput` is the number of training examples
+    the client processed per second (including the time it took to reply), which
+    client selection learns from.
+    """
+    # A complex metric strcuture can be returned by a ClientApp if it is first
+    # converted to a supported type by `flwr.common.Scalar`. Here we serialize it with
+    # JSON and therefore representing it as a string (one of the supported types)
+    complex_metric = {"a": 123, "b": random(), "mylist": [1, 2, 3, 4]}
+    complex_metric_str = json.dumps(complex_metric)
+    return {
+        "partition_id": partition_id,
+        "train_loss": train_loss,
+        "throughput": throughput,
+        "my_metric": complex_metric_str,
+    }
+
+
 class FlowerClient(NumPyClient):
-    def __init__(self, net, trainloader, valloader, local_epochs, context: Context):
+    def __init__(
+        self, net, trainloader, valloader, local_epochs, context: Context, cache_entry=None, cached=False
+    ):
         self.client_state = context.state
         self.net = net
         self.trainloader = trainloader
@@ -22,24 +72,64 @@ class FlowerClient(NumPyClient):
         self.local_epochs = local_epochs
         self.device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
         self.net.to(self.device)
+        self.partition_id = context.node_config["partition-id"]
+        self.metrics_log = MetricsLogger(
+            get_run_dir(context) / client_log_name(self.partition_id),
+            fsync=context.run_config["metrics-fsync"],
+        )
 
         if "fit_metrics" not in self.client_state.config_records:
             self.client_state.config_records["fit_metrics"] = ConfigRecord()
 
+        # How the locally-updated model is sent back (full weights or compressed delta)
+        self.codec = UpdateCodec.from_run_config(context.run_config)
+        # Extra time this client takes to reply (to simulate slow devices or links)
+        self.latency = parse_latency(context.run_config["simulated-latency"]).get(
+            self.partition_id, 0.0
+        )
+        # State of the partition kept between rounds (see `client_cache`) and whether it
+        # came from the cache; it also holds the optimizer if `client-optimizer-state` is set
+        self.cache_entry = cache_entry
+        self.cached = cached
+        self.keep_optimizer = context.run_config["client-optimizer-state"]
+        # Fast paths of local training and evaluation (bf16, channels-last, compile, fused)
+        self.train_options = TrainOptions.from_run_config(context.run_config)
+        # Spans of the phases of `fit` and `evaluate` (see `timing`)
+        self.tracer = None
+        if context.run_config["timing"]:
+            self.tracer = Tracer(
+                self.metrics_log, f"client_{self.partition_id}", partition_id=self.partition_id
+            )
+
     def fit(self, parameters, config):
         """Train a model using as starting point the parameters sent by the ServerApp.
 
         Then, communicate the weights of the locally-updated model back to the
         ServerApp.
         """
+        with activate(self.tracer, round=config["server_round"]), span("fit"):
+            return self._fit(parameters, config)
+
+    def _fit(self, parameters, config):
+        start = time.perf_counter()
         # Apply parameters to local model
-        set_weights(self.net, parameters)
+        with span("set_weights"):
+            set_weights(self.net, parameters)
+        optimizer = None
+        if self.keep_optimizer and self.cache_entry is not None:
+            if self.cache_entry.optimizer is None:
+                self.cache_entry.optimizer = self.train_options.optimizer(self.net, config["lr"])
+            optimizer = self.cache_entry.optimizer
+        # Shuffle in the order of this round, whether the trainloader is cached or not
+        self.trainloader.reseed(config["server_round"])
         train_loss = train(
             self.net,
             self.trainloader,
             self.local_epochs,
             config["lr"],
             self.device,
+            optimizer=optimizer,
+            options=self.train_options,
         )
 
         # Append to persistent state the `train_loss` just obtained
@@ -51,49 +141,99 @@ class FlowerClient(NumPyClient):
             # If it's not the first entry, append to the existing list
             fit_metrics["train_loss_hist"].append(train_loss)
 
-        # A complex metric strcuture can be returned by a ClientApp if it is first
-        # converted to a supported type by `flwr.common.Scalar`. Here we serialize it with
-        # JSON and therefore representing it as a string (one of the supported types)
-        complex_metric = {"a": 123, "b": random(), "mylist": [1, 2, 3, 4]}
-        complex_metric_str = json.dumps(complex_metric)
+        self.metrics_log.log(
+            event="fit",
+            round=config["server_round"],
+            partition_id=self.partition_id,
+            train_loss=train_loss,
+            num_examples=len(self.trainloader.dataset),
+            cached=self.cached,
+        )
+
+        # Parameters of the locally-updated model, or their compressed delta to the global
+        # model. The residual of error feedback is kept in the persistent state
+        # Views of the model are enough: they are encoded or serialized once `fit` returns,
+        # before the model of this partition trains again
+        with span("get_weights"):
+            weights = get_weights(self.net, copy=False)
+        if self.codec.enabled:
+            with span("encode"):
+                residual = None
+                if "update_residual" in self.client_state.array_records:
+                    residual = self.client_state.array_records["update_residual"].to_numpy_ndarrays()
+                weights, residual = self.codec.encode(weights, parameters, residual)
+                if residual is not None:
+                    self.client_state.array_records["update_residual"] = ArrayRecord(residual)
+
+        if self.latency:
+            with span("simulated_latency"):
+                time.sleep(self.latency)
+        num_examples = len(self.trainloader.dataset)
+        throughput = num_examples * self.local_epochs / (time.perf_counter() - start)
 
         return (
-            get_weights(self.net),  # Return parameters of the locally-updated model
+            weights,  # Return parameters of the locally-updated model
             len(
                 self.trainloader.dataset
             ),  # Training examples used (needed sometimes for aggregation)
-            {
-                "train_loss": train_loss,
-                "my_metric": complex_metric_str,
-            },  # Communicate metrics
+            build_fit_metrics(self.partition_id, train_loss, throughput),  # Communicate metrics
         )
 
     def evaluate(self, parameters, config):
         """Evaluate the global model weights using the local validation set."""
+        with activate(self.tracer, round=config["server_round"]), span("evaluate"):
+            return self._evaluate(parameters, config)
+
+    def _evaluate(self, parameters, config):
         # Apply weights from global model
-        set_weights(self.net, parameters)
+        with span("set_weights"):
+            set_weights(self.net, parameters)
         # Run the test evaluation function
-        loss, accuracy = test(self.net, self.valloader, self.device)
+        loss, accuracy = test(self.net, self.valloader, self.device, self.train_options)
+        self.metrics_log.log(
+            event="evaluate",
+            round=config["server_round"],
+            partition_id=self.partition_id,
+            loss=loss,
+            accuracy=accuracy,
+            num_examples=len(self.valloader.dataset),
+        )
         # Report results. Note the last argument is of type `Metrics` so you could communicate
         # other values that are relevant to your use case.
-        return loss, len(self.valloader.dataset), {"accuracy": accuracy}
+        return (
+            loss,
+            len(self.valloader.dataset),
+            {"accuracy": accuracy, "partition_id": self.partition_id},
+        )
 
 
 def client_fn(context: Context):
     """A function that returns a Client."""
 
-    # Instantiate the model
-    net = Net()
     # Read node config and fetch data for the ClientApp that is being constructed
     partition_id = context.node_config["partition-id"]
     num_partitions = context.node_config["num-partitions"]
-    trainloader, valloader = load_data(partition_id, num_partitions)
+    partitioning = Partitioning.from_run_config(context.run_config)
+
+    def create():
+        # Instantiate the model and load the partition
+        return ClientState(Net(), *load_data(partition_id, num_partitions, partitioning))
+
+    # Reuse what this process built for the partition on an earlier round of the run
+    state, cached = CLIENT_CACHE.get(
+        (partition_id, context.run_id),
+        create,
+        context.run_config["client-cache-size"],
+        context.run_config["client-cache-mb"],
+    )
 
     # Read the run config (defined in the `pyproject.toml`)
     local_epochs = context.run_config["local-epochs"]
 
     # Return Client instance
-    return FlowerClient(net, trainloader, valloader, local_epochs, context).to_client()
+    return FlowerClient(
+        state.net, state.trainloader, state.valloader, local_epochs, context, state, cached
+    ).to_client()
 
 
 # Flower ClientApp
@@ -0,0 +1,78 @@
+"""my-awesome-app: Keep the state of simulated ClientApps alive between rounds."""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import torch
+
+
+@dataclass
+class ClientState:
+    """What a ClientApp builds before it can train: its model, its data and (optionally)
+    the optimizer it continues with on its next round."""
+
+    net: torch.nn.Module
+    trainloader: object
+    valloader: object
+    optimizer: torch.optim.Optimizer | None = None
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the tensors of the state.
+
+        The partitions are private copies of their rows, gathered from the decoded split
+        of the partition store, so they are counted in full.
+        """
+        tensors = list(self.net.state_dict().values())
+        for loader in (self.trainloader, self.valloader):
+            tensors += [loader.dataset.images, loader.dataset.labels]
+        if self.optimizer is not None:
+            for state in self.optimizer.state.values():
+                tensors += [value for value in state.values() if torch.is_tensor(value)]
+        return sum(t.numel() * t.element_size() for t in tensors)
+
+
+class ClientCache:
+    """Bounded LRU of `ClientState`s, keyed by `(partition-id, run-id)`.
+
+    In a simulation the ClientApps of every partition run in a few long-lived
+    processes, which otherwise rebuild the model and reload the partition each time a
+    partition is sampled. An entry is evicted when the cache holds more than
+    `max_entries` states or when their `nbytes` add up to more than `budget_mb`
+    (0 for no budget). Sizes are measured on every access, so optimizer state created
+    since the entry was added counts too. The limits apply per process.
+    """
+
+    def __init__(self):
+        self.entries = OrderedDict()
+
+    def get(self, key, create, max_entries: int, budget_mb: float = 0.0) -> tuple[ClientState, bool]:
+        """Return the state of `key` (built with `create()` if it isn't cached) and
+        whether it was cached. With `max_entries = 0` nothing is kept."""
+        state = self.entries.pop(key, None)
+        cached = state is not None
+        if state is None:
+            state = create()
+        self.entries[key] = state
+        self.evict(max_entries, budget_mb)
+        return state, cached
+
+    def evict(self, max_entries: int, budget_mb: float = 0.0) -> None:
+        """Drop the least recently used states until the cache is within its limits."""
+        while len(self.entries) > max_entries:
+            self.entries.popitem(last=False)
+        if budget_mb:
+            budget = budget_mb * 2**20
+            sizes = {key: state.nbytes for key, state in self.entries.items()}
+            total = sum(sizes.values())
+            while self.entries and total > budget:
+                key, _ = self.entries.popitem(last=False)
+                total -= sizes[key]
+
+    def clear(self) -> None:
+        """Drop all the states."""
+        self.entries.clear()
+
+
+# States of the ClientApps simulated in this process
+CLIENT_CACHE = ClientCache()
@@ -0,0 +1,100 @@
+"""my-awesome-app: Compress the model updates ClientApps send to the ServerApp."""
+
+from dataclasses import dataclass
+
+import numpy as np
+
+QUANTIZATIONS = ("none", "fp16", "int8")
+
+
+@dataclass
+class UpdateCodec:
+    """Encode a model update as the (quantized, sparsified) delta to the global model.
+
+    A client sends `new - global` instead of its new weights. With `topk` in (0, 1)
+    only that fraction of the entries of each tensor (the largest in magnitude) is
+    sent, as int32 indices and values. The values are sent as float32, float16 or int8
+    (with one float32 scale per tensor) depending on `quantization`. With
+    `error_feedback`, whatever the encoding drops is kept by the client as a residual
+    and added to its next update, so nothing is lost over the rounds.
+
+    Every tensor is encoded as `[values, scale]`, or `[indices, values, scale]` with
+    top-k, so the payload is a flat list of arrays like `get_weights` returns.
+    """
+
+    quantization: str = "none"
+    topk: float = 0.0
+    error_feedback: bool = True
+
+    def __post_init__(self):
+        if self.quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization '{self.quantization}' (expected one of {QUANTIZATIONS})")
+        if not 0.0 <= self.topk < 1.0:
+            raise ValueError(f"`topk` must be in [0, 1), got {self.topk}")
+
+    @classmethod
+    def from_run_config(cls, run_config) -> "UpdateCodec":
+        return cls(
+            quantization=run_config["update-quantization"],
+            topk=run_config["update-topk"],
+            error_feedback=run_config["update-error-feedback"],
+        )
+
+    @property
+    def enabled(self) -> bool:
+        """Whether updates are encoded at all (otherwise clients send their weights)."""
+        return self.quantization != "none" or self.topk > 0.0
+
+    def _quantize(self, values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        if self.quantization == "fp16":
+            return values.astype(np.float16), np.ones(1, dtype=np.float32)
+        if self.quantization == "int8":
+            peak = np.abs(values).max() if values.size else 0.0
+            scale = np.float32(peak / 127.0 if peak > 0 else 1.0)
+            return np.round(values / scale).astype(np.int8), np.array([scale], dtype=np.float32)
+        return values.astype(np.float32), np.ones(1, dtype=np.float32)
+
+    def encode(self, new_weights, global_weights, residual=None):
+        """Return the payload encoding `new_weights` and the residual to keep.
+
+        `residual` is the one returned by the previous call (or `None`).
+        """
+        payload, new_residual = [], []
+        for i, (new, old) in enumerate(zip(new_weights, global_weights)):
+            delta = (new - old).astype(np.float32).reshape(-1)
+            if residual is not None:
+                delta += residual[i].reshape(-1)
+            if self.topk > 0.0:
+                k = max(1, int(round(self.topk * delta.size)))
+                indices = np.argpartition(np.abs(delta), -k)[-k:].astype(np.int32)
+                values, scale = self._quantize(delta[indices])
+                payload += [indices, values, scale]
+                sent = np.zeros_like(delta)
+                sent[indices] = values.astype(np.float32) * scale[0]
+            else:
+                values, scale = self._quantize(delta)
+                payload += [values, scale]
+                sent = values.astype(np.float32) * scale[0]
+            new_residual.append((delta - sent).reshape(new.shape))
+        return payload, (new_residual if self.error_feedback else None)
+
+    def decode(self, payload, global_weights):
+        """Rebuild the weights of a client from its payload and the global weights."""
+        width = 3 if self.topk > 0.0 else 2
+        weights = []
+        for i, old in enumerate(global_weights):
+            arrays = payload[i * width : (i + 1) * width]
+            scale = arrays[-1][0]
+            if self.topk > 0.0:
+                indices, values = arrays[0], arrays[1]
+                delta = np.zeros(old.size, dtype=np.float32)
+                delta[indices] = values.astype(np.float32) * scale
+            else:
+                delta = arrays[0].astype(np.float32) * scale
+            weights.append(old + delta.reshape(old.shape))
+        return weights
+
+
+def payload_bytes(tensors) -> int:
+    """Size in bytes of serialized arrays (the `tensors` of Flower `Parameters`)."""
+    return sum(len(tensor) for tensor in tensors)
@@ -0,0 +1,147 @@
+"""my-awesome-app: Pre-decoded FashionMNIST and its partitions stored on disk."""
+
+import os
+from pathlib import Path
+
+import numpy as np
+import torch
+from datasets import load_dataset
+
+from app_research_project.partitioning import Partitioning, compute_partition_index
+
+DATASET = "zalando-datasets/fashion_mnist"
+
+# Directory the dataset and the partition indexes are stored in (shared by all runs of a machine)
+STORE_DIR = Path(
+    os.environ.get("PARTITION_STORE_DIR", Path(__file__).resolve().parent.parent / ".partition_store")
+)
+
+SPLITS = ("train", "test")
+
+indexes = {}  # Cache the partition indexes read by this process
+
+
+def partition_key(partitioning: Partitioning, num_partitions: int) -> str:
+    """Name identifying a partitioning of the dataset in the store."""
+    return f"{DATASET.split('/')[-1]}-{partitioning.key(num_partitions)}"
+
+
+def decode(dataset) -> tuple[np.ndarray, np.ndarray]:
+    """Decode a FashionMNIST split into normalized float32 images and int64 labels.
+
+    The images have shape (N, 1, 28, 28) and the same values `ToTensor()` followed by
+    `Normalize((0.5,), (0.5,))` produce, so no transform is left to apply per batch.
+    """
+    columns = dataset.with_format("numpy")[:]
+    images = columns["image"][:, None].astype(np.float32) / 255.0
+    images = (images - 0.5) / 0.5
+    return np.ascontiguousarray(images), columns["label"].astype(np.int64)
+
+
+def _save(path: Path, array: np.ndarray) -> None:
+    """Write `array` to `path` atomically, so concurrent clients never read a partial file."""
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp, path)
+
+
+def _load_arrays(paths: dict) -> dict:
+    """Memory-map stored arrays as tensors that share the pages of their files."""
+    # Copy-on-write maps are writable, which `torch.from_numpy` expects
+    return {key: torch.from_numpy(np.load(path, mmap_mode="c")) for key, path in paths.items()}
+
+
+def load_split(split: str, store_dir=STORE_DIR) -> tuple[torch.Tensor, torch.Tensor]:
+    """Return the `(images, labels)` tensors of a whole split of FashionMNIST.
+
+    The split is decoded once and memory-mapped afterwards, so the processes of a
+    machine share a single copy of it in the page cache. Pointing
+    `PARTITION_STORE_DIR` to a `tmpfs` (e.g. `/dev/shm`) keeps it in RAM.
+    """
+    directory = Path(store_dir) / f"{DATASET.split('/')[-1]}-{split}"
+    paths = {name: directory / f"{name}.npy" for name in ("images", "labels")}
+    if not all(path.exists() for path in paths.values()):
+        directory.mkdir(parents=True, exist_ok=True)
+        images, labels = decode(load_dataset(DATASET, split=split))
+        _save(paths["images"], images)
+        _save(paths["labels"], labels)
+
+    tensors = _load_arrays(paths)
+    return tensors["images"], tensors["labels"]
+
+
+def load_partition_index(
+    num_partitions: int, partitioning: Partitioning = Partitioning(), store_dir=STORE_DIR
+) -> dict[str, np.ndarray]:
+    """Return the index of a partitioning (see `partitioning.compute_partition_index`).
+
+    It is computed once per partitioning and number of partitions and stored as int32
+    rows in a single `index.npz` under `store_dir`, shared by every run and sweep cell
+    using that partitioning.
+    """
+    directory = Path(store_dir) / partition_key(partitioning, num_partitions)
+    path = directory / "index.npz"
+    if path not in indexes:
+        if not path.exists():
+            directory.mkdir(parents=True, exist_ok=True)
+            _, labels = load_split("train", store_dir)
+            index = compute_partition_index(labels.numpy(), num_partitions, partitioning)
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            with open(tmp, "wb") as f:
+                np.savez(f, **index)
+            os.replace(tmp, path)
+        with np.load(path) as npz:
+            indexes[path] = dict(npz)
+    return indexes[path]
+
+
+def load_partition(
+    partition_id: int,
+    num_partitions: int,
+    partitioning: Partitioning = Partitioning(),
+    store_dir=STORE_DIR,
+) -> dict[str, tuple[torch.Tensor, torch.Tensor]]:
+    """Return the `(images, labels)` tensors of the train and test split of a partition.
+
+    They are gathered by index from the decoded train split (see `load_split` and
+    `load_partition_index`): nothing is decoded, whatever the partitioning.
+    """
+    index = load_partition_index(num_partitions, partitioning, store_dir)
+    images, labels = load_split("train", store_dir)
+    partition = {}
+    for split in SPLITS:
+        offsets = index[f"{split}_offsets"]
+        rows = index[f"{split}_rows"][offsets[partition_id] : offsets[partition_id + 1]]
+        rows = torch.from_numpy(rows.astype(np.int64))
+        partition[split] = (images[rows], labels[rows])
+    return partition
+
+
+def class_counts(
+    num_partitions: int, partitioning: Partitioning = Partitioning(), store_dir=STORE_DIR
+) -> np.ndarray:
+    """Number of examples of each class (columns) in each partition (rows).
+
+    Counts the train and test split of the partitions together, as the partitioner
+    assigned them. Only the index and the labels are read.
+    """
+    index = load_partition_index(num_partitions, partitioning, store_dir)
+    _, labels = load_split("train", store_dir)
+    labels = labels.numpy()
+    num_classes = int(labels.max()) + 1
+    counts = np.zeros((num_partitions, num_classes), dtype=np.int64)
+    for split in SPLITS:
+        offsets = index[f"{split}_offsets"]
+        partition_ids = np.repeat(np.arange(num_partitions), np.diff(offsets))
+        np.add.at(counts, (partition_ids, labels[index[f"{split}_rows"]]), 1)
+    return counts
+
+
+def load_testset(store_dir=STORE_DIR) -> tuple[torch.Tensor, torch.Tensor]:
+    """Return the `(images, labels)` tensors of the global FashionMNIST test set.
+
+    Like the train split, it is decoded once and memory-mapped afterwards, so the
+    ServerApps of concurrent sweep cells share a single copy of it in the page cache.
+    """
+    return load_split("test", store_dir)
\ No newline at end of file
@@ -0,0 +1,100 @@
+"""my-awesome-app: A Flower `Server` aggregating updates as they arrive, up to a deadline."""
+
+import concurrent.futures
+import timeit
+from functools import partial
+from logging import INFO
+
+from flwr.common import Code
+from flwr.common.logger import log
+from flwr.server import Server
+from flwr.server.server import fit_client
+
+
+class DeadlineServer(Server):
+    """Run synchronous rounds, folding each update in as soon as it arrives.
+
+    Every update received is passed to `strategy.fold_update`, so the round is
+    aggregated while the other clients are still training and the received updates
+    aren't held until the end of the round, as `Server.fit_round` does.
+
+    A round is aggregated as soon as `strategy.fit_target` clients have returned
+    their update, or once `deadline` seconds have passed (0 waits for the target),
+    whichever comes first. Without over-sampling and deadline this waits for every
+    sampled client, like `Server`. Over-sampling (`oversample` of `CustomFedAvg`)
+    gives the round a margin of clients to lose. The clients that didn't make it are
+    reported to the strategy as dropped; they finish in the background and their
+    updates are discarded (the strategy still learns their partition from the reply).
+    """
+
+    def __init__(self, *, client_manager, strategy, deadline=0.0):
+        super().__init__(client_manager=client_manager, strategy=strategy)
+        self.deadline = deadline
+
+    def fit_round(self, server_round: int, timeout: float | None):
+        """Perform a single round of federated averaging, up to the deadline."""
+        client_instructions = self.strategy.configure_fit(
+            server_round=server_round,
+            parameters=self.parameters,
+            client_manager=self._client_manager,
+        )
+        if not client_instructions:
+            log(INFO, "configure_fit: no clients selected, cancel")
+            return None
+        log(
+            INFO,
+            "configure_fit: strategy sampled %s clients (out of %s), waiting for %s",
+            len(client_instructions),
+            self._client_manager.num_available(),
+            self.strategy.fit_target,
+        )
+
+        start = timeit.default_timer()
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers)
+        pending = {
+            executor.submit(fit_client, client, ins, timeout, server_round): client
+            for client, ins in client_instructions
+        }
+        results, failures = [], []
+        while pending and len(results) < self.strategy.fit_target:
+            remaining = None
+            if self.deadline:
+                remaining = self.deadline - (timeit.default_timer() - start)
+                if remaining <= 0:
+                    break
+            done, _ = concurrent.futures.wait(
+                pending, timeout=remaining, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                client = pending.pop(future)
+                if future.exception() is not None:
+                    failures.append(future.exception())
+                    continue
+                _, fit_res = future.result()
+                if fit_res.status.code == Code.OK:
+                    self.strategy.fold_update(server_round, fit_res)
+                    results.append((client, fit_res))
+                else:
+                    failures.append((client, fit_res))
+        # Don't wait for the dropped clients (their threads end when they reply)
+        for future, client in pending.items():
+            future.add_done_callback(partial(self._learn_partition, client))
+        executor.shutdown(wait=False, cancel_futures=True)
+        dropped = list(pending.values())
+        log(
+            INFO,
+            "aggregate_fit: received %s results and %s failures, dropped %s clients",
+            len(results),
+            len(failures),
+            len(dropped),
+        )
+        self.strategy.record_dropped(dropped)
+        parameters_aggregated, metrics_aggregated = self.strategy.aggregate_fit(
+            server_round, results, failures
+        )
+        return parameters_aggregated, metrics_aggregated, (results, failures)
+
+    def _learn_partition(self, client, future: concurrent.futures.Future) -> None:
+        """Pass the late reply of a dropped client to `strategy.learn_partition`."""
+        if not future.cancelled() and future.exception() is None:
+            self.strategy.learn_partition(client, future.result()[1])
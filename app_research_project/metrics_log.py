@@ -0,0 +1,100 @@
+"""my-awesome-app: Structured, append-only metrics records of a run."""
+
+import json
+import os
+import time
+from pathlib import Path
+
+from flwr.common import Context
+
+SERVER_LOG = "server.jsonl"
+
+
+def get_run_dir(context: Context) -> Path:
+    """Return (and create) the directory where the outputs of this run are written.
+
+    The directory is read from the `run-dir` entry of the run config. When it is left
+    empty, a `runs/<run-id>` directory in the working directory is used.
+    """
+    run_dir = Path(context.run_config.get("run-dir") or Path("runs") / str(context.run_id))
+    run_dir.mkdir(parents=True, exist_ok=True)
+    return run_dir
+
+
+def client_log_name(partition_id: int) -> str:
+    """Name of the file a ClientApp writes its records to."""
+    return f"client_{partition_id}.jsonl"
+
+
+def parse_fsync(value) -> float | None:
+    """Parse the `metrics-fsync` entry of the run config.
+
+    `"never"` leaves flushing to the OS, `"always"` syncs every record to disk and a
+    number of seconds syncs at most once per interval.
+    """
+    if value in ("never", "", None):
+        return None
+    if value == "always":
+        return 0.0
+    return float(value)
+
+
+class MetricsLogger:
+    """Append one JSON record per line to a `.jsonl` file.
+
+    Each ClientApp and the ServerApp write to their own file, so records from
+    concurrent actors never interleave. Records are only ever appended: writing one
+    costs the same on the first and the last round of a run. `fsync` (see
+    `parse_fsync`) controls how often they are synced to disk.
+    """
+
+    def __init__(self, path, fsync="never"):
+        self.path = Path(path)
+        self.fsync_interval = parse_fsync(fsync)
+        self.last_fsync = 0.0
+
+    def log(self, **record) -> None:
+        """Append `record` to the file."""
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+            if self.fsync_interval is not None:
+                now = time.monotonic()
+                if now - self.last_fsync >= self.fsync_interval:
+                    f.flush()
+                    os.fsync(f.fileno())
+                    self.last_fsync = now
+
+
+def read_records(path) -> list[dict]:
+    """Return all records stored in a `.jsonl` file (empty if it doesn't exist)."""
+    path = Path(path)
+    if not path.exists():
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def read_client_records(run_dir) -> list[dict]:
+    """Return the records written by every ClientApp of a run."""
+    records = []
+    for path in sorted(Path(run_dir).glob(client_log_name("*"))):
+        records.extend(read_records(path))
+    return records
+
+
+def results_view(run_dir) -> dict[str, dict]:
+    """Return the metrics of the global model per round, as `results.json` held them.
+
+    i.e. `{"<round>": {"loss": ..., "cen_accuracy": ...}}`, rebuilt from the records.
+    """
+    return {str(server_round): metrics for server_round, metrics in round_metrics(run_dir).items()}
+
+
+def round_metrics(run_dir, event: str = "evaluate") -> dict[int, dict]:
+    """Return the server records of a given `event`, indexed by round."""
+    rounds = {}
+    for record in read_records(Path(run_dir) / SERVER_LOG):
+        if record.get("event") == event:
+            metrics = {k: v for k, v in record.items() if k not in ("event", "round")}
+            rounds.setdefault(record["round"], {}).update(metrics)
+    return rounds
@@ -1,30 +1,442 @@
+import abc
+import atexit
 import json
+import math
+import queue
+import random
+import threading
+import time
 from datetime import datetime
+from logging import WARNING
+from pathlib import Path
 
+import numpy as np
 import torch
-import wandb
-from flwr.common import FitRes, Parameters, parameters_to_ndarrays
+from flwr.common import (
+    EvaluateRes,
+    FitIns,
+    FitRes,
+    NDArrays,
+    Parameters,
+    ndarrays_to_parameters,
+    parameters_to_ndarrays,
+)
+from flwr.common.logger import log
 from flwr.server.client_proxy import ClientProxy
+from flwr.server.client_manager import ClientManager
 from flwr.server.strategy import FedAvg
+from flwr.server.strategy.aggregate import weighted_loss_avg
 
-from .task import Net, set_weights
+from .checkpoint import CheckpointWriter
+from .compression import UpdateCodec, payload_bytes
+from .data_store import load_partition
+from .metrics_log import SERVER_LOG, MetricsLogger
+from .partitioning import Partitioning
+from .task import Net, set_weights, state_dict_from_weights, test_shards
+from .timing import Tracer, activate, span, write_chrome_trace
+
+TRACKER_LOG = "tracker.jsonl"
+
+
+class Tracker(abc.ABC):
+    """Where `CustomFedAvg` reports the metrics of the global model after each round."""
+
+    @abc.abstractmethod
+    def log(self, metrics: dict, step: int) -> None:
+        """Report the `metrics` of round `step`."""
+
+    def close(self) -> None:
+        """Flush what's pending and release the resources of the tracker."""
+
+
+class NoOpTracker(Tracker):
+    """Discard all metrics (the run directory still holds the records of the run)."""
+
+    def log(self, metrics: dict, step: int) -> None:
+        pass
+
+
+class FileTracker(Tracker):
+    """Append metrics as JSON lines to a local file, without blocking the rounds.
+
+    `log` only queues the record. A background thread writes the queued records in
+    batches, every `flush_interval` seconds or as soon as `batch_size` are pending,
+    and `close` (also called at exit) writes whatever is left. Nothing here needs
+    network access.
+    """
+
+    def __init__(self, path, batch_size=32, flush_interval=5.0):
+        self.path = Path(path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="file-tracker", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def log(self, metrics: dict, step: int) -> None:
+        self.queue.put({"step": step, "time": time.time(), **metrics})
+
+    def close(self) -> None:
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        atexit.unregister(self.close)
+
+    def _run(self):
+        pending, done = [], False
+        while not done:
+            deadline = time.monotonic() + self.flush_interval
+            while len(pending) < self.batch_size:
+                try:
+                    record = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if record is None:
+                    done = True
+                    break
+                pending.append(record)
+            if pending:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.writelines(json.dumps(record) + "\n" for record in pending)
+                pending = []
+
+
+class WandbTracker(Tracker):
+    """Push metrics to Weight & Biases (needs network access and a W&B login)."""
+
+    def __init__(self, project="flower-simulation-tutorial"):
+        import wandb  # pylint: disable=import-outside-toplevel
+
+        self.wandb = wandb
+        name = datetime.now().strftime("%Y-%m-%d_%H:%M:%S")
+        wandb.init(project=project, name=f"custom-strategy-{name}")
+
+    def log(self, metrics: dict, step: int) -> None:
+        self.wandb.log(metrics, step=step)
+
+    def close(self) -> None:
+        # Finish the W&B run so a new one can be started in the same process
+        self.wandb.finish()
+
+
+def make_tracker(kind: str, run_dir) -> Tracker:
+    """Build the tracker selected by the `tracker` entry of the run config."""
+    if kind == "file":
+        return FileTracker(Path(run_dir) / TRACKER_LOG)
+    if kind == "wandb":
+        return WandbTracker()
+    if kind == "none":
+        return NoOpTracker()
+    raise ValueError(f"Unknown tracker '{kind}' (expected 'file', 'wandb' or 'none')")
+
+
+class OortSelector:
+    """Pick the clients that are expected to help the model the most per unit of time.
+
+    Client selection after Oort (Lai et al., OSDI '21). From the fit metrics of every
+    client the selector keeps its statistical utility (training examples x training
+    loss: clients whose data the model fits badly have more to teach it) and an
+    exponential moving average of its throughput (`throughput` metric, examples per
+    second). A client expected to take longer than the median client has its utility
+    scaled by `(median / duration) ** alpha`, so slow clients are only picked when
+    their data is worth the wait.
+
+    Clients never seen are tried first. A fraction `fairness` of the slots of each
+    round goes to the clients selected the fewest times so far, so that no client is
+    starved and the estimates of the others don't go stale.
+    """
+
+    def __init__(self, fairness=0.2, alpha=2.0, smoothing=0.5, seed=None):
+        self.fairness = fairness
+        self.alpha = alpha
+        self.smoothing = smoothing
+        self.rng = random.Random(seed)
+        self.utility = {}  # Statistical utility of each client (by cid)
+        self.throughput = {}  # Moving average of the examples per second of each client
+        self.num_examples = {}
+        self.times_selected = {}
+
+    def update(self, cid: str, num_examples: int, metrics: dict) -> None:
+        """Learn from the fit result of a client."""
+        self.utility[cid] = num_examples * metrics["train_loss"]
+        self.num_examples[cid] = num_examples
+        throughput = metrics["throughput"]
+        if cid in self.throughput:
+            throughput = self.smoothing * throughput + (1 - self.smoothing) * self.throughput[cid]
+        self.throughput[cid] = throughput
+
+    def penalize(self, cid: str) -> None:
+        """A client missed the round deadline: halve its estimated throughput."""
+        if cid in self.throughput:
+            self.throughput[cid] /= 2
+
+    def duration(self, cid: str) -> float:
+        return self.num_examples[cid] / self.throughput[cid]
+
+    def score(self, cid: str, preferred_duration: float) -> float:
+        if cid not in self.throughput:
+            return math.inf  # Explore the clients never seen
+        utility = self.utility[cid]
+        duration = self.duration(cid)
+        if duration > preferred_duration:
+            utility *= (preferred_duration / duration) ** self.alpha
+        return utility
+
+    def select(self, clients: list[ClientProxy], num_clients: int) -> list[ClientProxy]:
+        """Return `num_clients` of `clients`."""
+        by_cid = {client.cid: client for client in clients}
+        # Random tie-breaks, e.g. among the clients not seen yet
+        tie_breaks = {cid: self.rng.random() for cid in by_cid}
+        # Fairness floor: slots for the clients selected the fewest times
+        least_selected = sorted(
+            by_cid, key=lambda cid: (self.times_selected.get(cid, 0), tie_breaks[cid])
+        )
+        chosen = least_selected[: round(self.fairness * num_clients)]
+        # Fill the remaining slots in order of utility
+        known = [self.duration(cid) for cid in by_cid if cid in self.throughput]
+        preferred = sorted(known)[len(known) // 2] if known else 0.0
+        remaining = sorted(
+            (cid for cid in by_cid if cid not in chosen),
+            key=lambda cid: (-self.score(cid, preferred), tie_breaks[cid]),
+        )
+        chosen += remaining[: num_clients - len(chosen)]
+        for cid in chosen:
+            self.times_selected[cid] = self.times_selected.get(cid, 0) + 1
+        return [by_cid[cid] for cid in chosen]
+
+
+def make_client_selector(run_config: dict) -> OortSelector | None:
+    """Build the client selector of the `client-selection` entry of the run config."""
+    kind = run_config["client-selection"]
+    if kind == "uniform":
+        return None  # Flower's `ClientManager` samples clients uniformly at random
+    if kind == "oort":
+        return OortSelector(
+            fairness=run_config["oort-fairness"],
+            alpha=run_config["oort-alpha"],
+            seed=run_config["seed"],
+        )
+    raise ValueError(f"Unknown client selection '{kind}' (expected 'uniform' or 'oort')")
+
+
+class WeightedAverage:
+    """Running weighted average of model parameters, folded in one client at a time.
+
+    Each update is added in place to float64 accumulators, so only the accumulators
+    and the update being folded in are alive, however many clients take part.
+    """
+
+    def __init__(self):
+        self.sums = None
+        self.dtypes = None
+        self.total = 0
+
+    def add(self, ndarrays: NDArrays, num_examples: int) -> None:
+        if self.sums is None:
+            self.sums = [np.zeros(array.shape, dtype=np.float64) for array in ndarrays]
+            self.dtypes = [array.dtype for array in ndarrays]
+        for acc, array in zip(self.sums, ndarrays, strict=True):
+            acc += np.multiply(array, num_examples, dtype=np.float64)
+        self.total += num_examples
+
+    def result(self) -> NDArrays:
+        """The average, in the dtypes of the updates."""
+        return [(acc / self.total).astype(dtype) for acc, dtype in zip(self.sums, self.dtypes)]
 
 
 class CustomFedAvg(FedAvg):
     """A strategy that keeps the core functionality of FedAvg unchanged but enables
     additional features such as: Saving global checkpoints, saving metrics to the local
-    file system as a JSON, pushing metrics to Weight & Biases.
+    file system as JSON records, pushing metrics to a `Tracker` (a local file, Weight &
+    Biases or nowhere). Every round is recorded as structured records in the
+    `server.jsonl` file of the run directory (`metrics_log.results_view` rebuilds the
+    dictionary `results.json` used to hold).
+
+    With `batched_client_eval`, the ClientApps don't evaluate the global model: the
+    strategy evaluates it at once over the validation sets of all partitions (see
+    `evaluate_clients_batched`). This is only possible in simulation, where the server
+    can read the partitions of the clients.
+
+    With `oversample` > 1, each round samples that many times more clients than
+    `fraction_fit` asks for. Run by a `DeadlineServer`, the round is aggregated once
+    `fit_target` (the number `fraction_fit` asks for) have returned or at its deadline,
+    and the clients left out are recorded as dropped.
+
+    With a `client_selector` (e.g. `OortSelector`), the clients of each round are
+    picked by it instead of uniformly at random, and it learns from their results.
+
+    Updates are aggregated as they arrive: the server running the rounds (a
+    `DeadlineServer`) passes each `FitRes` to `fold_update` as soon as it's received,
+    which folds its parameters into the `WeightedAverage` of the round and releases
+    them. The server never holds the updates of the whole round, so its memory doesn't
+    grow with the number of clients. `aggregate_fit` folds in whatever wasn't folded yet.
+
+    With `timing`, the phases of each round (aggregation, checkpoints, evaluation)
+    are recorded as spans, and `close` gathers them with those of the clients into
+    the Chrome trace of the run (see `timing`).
     """
 
-    def __init__(self, *args, **kwargs):
+    def __init__(
+        self,
+        *args,
+        run_dir=".",
+        metrics_fsync="never",
+        batched_client_eval=False,
+        checkpoint_keep_last=0,
+        checkpoint_every=0,
+        tracker: Tracker | None = None,
+        update_codec: UpdateCodec | None = None,
+        oversample=1.0,
+        client_selector: OortSelector | None = None,
+        timing=False,
+        partitioning: Partitioning | None = None,
+        **kwargs,
+    ):
         super().__init__(*args, **kwargs)
+        self.oversample = oversample
+        self.client_selector = client_selector
+        # Updates a round needs before it is aggregated (set when clients are sampled)
+        self.fit_target = 0
+        # Clients sampled in the current round whose updates didn't arrive in time (by
+        # partition), and the partition of each client that replied so far (by cid)
+        self.dropped = []
+        self.partition_ids = {}
+        self.batched_client_eval = batched_client_eval
+        # Concatenated validation sets of the partitions (built on first use)
+        self.client_valsets = None
+        self.partitioning = partitioning or Partitioning()
+        self.client_eval_model = Net()
+        # Names of the tensors of the model, to save checkpoints from the aggregated arrays
+        self.state_keys = list(self.client_eval_model.state_dict().keys())
 
-        # A dictionary that will store the metrics generated on each round
-        self.results_to_save = {}
+        # Append-only record of the metrics of each round, read by the sweep runners
+        self.metrics_log = MetricsLogger(f"{run_dir}/{SERVER_LOG}", fsync=metrics_fsync)
+        self.run_dir = Path(run_dir)
+        self.tracer = Tracer(self.metrics_log, "server") if timing else None
+        self.round_start = None  # When the clients of the current round were sampled
 
-        # Log those same metrics to W&B
-        name = datetime.now().strftime("%Y-%m-%d_%H:%M:%S")
-        wandb.init(project="flower-simulation-tutorial", name=f"custom-strategy-{name}")
+        # Checkpoints are written in the background while the next round runs
+        self.checkpoints = CheckpointWriter(
+            run_dir, keep_last=checkpoint_keep_last, every=checkpoint_every, tracer=self.tracer
+        )
+
+        # Decodes the compressed updates of the clients (if they compress them)
+        self.update_codec = update_codec if update_codec is not None else UpdateCodec()
+        # Global model sent in the current round (the reference of the client deltas)
+        self.global_ndarrays = None
+        self.model_bytes = 0
+        self.bytes_down = 0
+        # Running average of the updates received in the current round, and their bytes
+        self.round_average = None
+        self.bytes_up = 0
+
+        # Log those same metrics to the experiment tracker
+        self.tracker = tracker if tracker is not None else NoOpTracker()
+        # Also write the trace when the run ends without `close` being called
+        atexit.register(self.close)
+
+    def num_fit_clients(self, num_available_clients: int) -> tuple[int, int]:
+        """Return the sample size (over-sampled) and the required number of clients."""
+        sample_size, min_num_clients = super().num_fit_clients(num_available_clients)
+        self.fit_target = sample_size
+        return min(math.ceil(sample_size * self.oversample), num_available_clients), min_num_clients
+
+    def learn_partition(self, client: ClientProxy, res: FitRes | EvaluateRes) -> None:
+        """Remember the partition of `client` from the metrics of one of its replies."""
+        if "partition_id" in res.metrics:
+            self.partition_ids[client.cid] = res.metrics["partition_id"]
+
+    def record_dropped(self, clients: list[ClientProxy]) -> None:
+        """Record the partitions of the clients the server stopped waiting for this round.
+
+        Clients that never replied to the server yet are recorded as `None`.
+        """
+        self.dropped = [self.partition_ids.get(client.cid) for client in clients]
+        if self.client_selector is not None:
+            for client in clients:
+                self.client_selector.penalize(client.cid)
+
+    def configure_fit(
+        self, server_round: int, parameters: Parameters, client_manager: ClientManager
+    ):
+        """Configure the next round of training and keep track of the model sent."""
+        self.round_start = time.time()
+        if self.client_selector is None:
+            instructions = super().configure_fit(server_round, parameters, client_manager)
+        else:
+            config = {}
+            if self.on_fit_config_fn is not None:
+                config = self.on_fit_config_fn(server_round)
+            fit_ins = FitIns(parameters, config)
+            sample_size, min_num_clients = self.num_fit_clients(client_manager.num_available())
+            client_manager.wait_for(min_num_clients)
+            clients = self.client_selector.select(list(client_manager.all().values()), sample_size)
+            instructions = [(client, fit_ins) for client in clients]
+        if self.update_codec.enabled:
+            self.global_ndarrays = parameters_to_ndarrays(parameters)
+        self.model_bytes = payload_bytes(parameters.tensors)
+        self.bytes_down = self.model_bytes * len(instructions)
+        self.round_average = None
+        self.bytes_up = 0
+        return instructions
+
+    def decode_update(self, fit_res: FitRes, reference: NDArrays | None = None) -> NDArrays:
+        """Return the model parameters a client sent, decompressing them if needed.
+
+        Compressed updates are deltas to `reference`, the global model the client
+        trained from (by default the one sent in the current round).
+        """
+        ndarrays = parameters_to_ndarrays(fit_res.parameters)
+        if self.update_codec.enabled:
+            ref = reference if reference is not None else self.global_ndarrays
+            ndarrays = self.update_codec.decode(ndarrays, ref)
+        return ndarrays
+
+    def fold_update(self, server_round: int, fit_res: FitRes) -> None:
+        """Fold the update of a client into the average of the round as it arrives.
+
+        The parameters of `fit_res` are decoded, added to the running average and
+        released; its metrics are kept for `aggregate_fit`.
+        """
+        with activate(self.tracer, round=server_round), span("fold_update"):
+            if self.round_average is None:
+                self.round_average = WeightedAverage()
+            self.bytes_up += payload_bytes(fit_res.parameters.tensors)
+            self.round_average.add(self.decode_update(fit_res), fit_res.num_examples)
+            # Drop the serialized update, nothing reads it past this point
+            fit_res.parameters.tensors.clear()
+
+    def aggregate_fit_metrics(
+        self, server_round: int, results: list[tuple[ClientProxy, FitRes]]
+    ) -> dict[str, bool | bytes | float | int | str]:
+        """Aggregate custom metrics if aggregation fn was provided."""
+        metrics_aggregated = {}
+        if self.fit_metrics_aggregation_fn:
+            fit_metrics = [(res.num_examples, res.metrics) for _, res in results]
+            metrics_aggregated = self.fit_metrics_aggregation_fn(fit_metrics)
+        elif server_round == 1:  # Only log this warning once
+            log(WARNING, "No fit_metrics_aggregation_fn provided")
+        return metrics_aggregated
+
+    def save_checkpoint(self, server_round: int, parameters: Parameters) -> None:
+        """Save new Global Model as a PyTorch checkpoint."""
+
+        def state_dict():
+            # Convert parameters to ndarrays (in the writer thread)
+            ndarrays = parameters_to_ndarrays(parameters)
+            # Saved in the standard PyTorch way (no model is needed for that)
+            return state_dict_from_weights(self.state_keys, ndarrays)
+
+        with activate(self.tracer, round=server_round), span("checkpoint"):
+            self.checkpoints.save(server_round, state_dict)
+
+    def record_fit_round(self, server_round: int) -> None:
+        """Record the span from sampling the clients of the round to aggregating it."""
+        if self.tracer is not None and self.round_start is not None:
+            self.tracer.record(
+                "fit_round", self.round_start, time.time() - self.round_start, round=server_round
+            )
 
     def aggregate_fit(
         self,
@@ -32,44 +444,234 @@ class CustomFedAvg(FedAvg):
         results: list[tuple[ClientProxy, FitRes]],
         failures: list[tuple[ClientProxy, FitRes] | BaseException],
     ) -> tuple[Parameters | None, dict[str, bool | bytes | float | int | str]]:
-        """Aggregate received model updates and metrics, ave global model checkpoint."""
+        """Aggregate received model updates and metrics, ave global model checkpoint.
 
-        # Call the default aggregate_fit method from FedAvg
-        parameters_aggregated, metrics_aggregated = super().aggregate_fit(
-            server_round, results, failures
-        )
+        Same results as `FedAvg.aggregate_fit`, but computed with a `WeightedAverage`
+        the updates were folded into by `fold_update`. Those of `results` that weren't
+        (e.g. run by Flower's `Server` or the stacked engine) are folded in first.
+        """
+        # Do not aggregate without results, or if there are failures and failures are
+        # not accepted (the round is still recorded)
+        if not results or (not self.accept_failures and failures):
+            self.round_average = None
+            self.metrics_log.log(
+                event="fit",
+                round=server_round,
+                num_results=len(results),
+                num_failures=len(failures),
+                num_dropped=len(self.dropped),
+                dropped=self.dropped,
+            )
+            self.dropped = []
+            return None, {}
+
+        for client, fit_res in results:
+            self.learn_partition(client, fit_res)
+            if fit_res.parameters.tensors:
+                self.fold_update(server_round, fit_res)
+            if self.client_selector is not None:
+                self.client_selector.update(client.cid, fit_res.num_examples, fit_res.metrics)
+        with activate(self.tracer, round=server_round), span("aggregation", num_results=len(results)):
+            parameters_aggregated = ndarrays_to_parameters(self.round_average.result())
+        self.round_average = None
+        metrics_aggregated = self.aggregate_fit_metrics(server_round, results)
 
-        ## Save new Global Model as a PyTorch checkpoint
-        # Convert parameters to ndarrays
-        ndarrays = parameters_to_ndarrays(parameters_aggregated)
-        # Instantiate model
-        model = Net()
-        # Apply paramters to model
-        set_weights(model, ndarrays)
-        # Save global model in the standard PyTorch way
-        torch.save(model.state_dict(), f"global_model_round_{server_round}")
+        self.metrics_log.log(
+            event="fit",
+            round=server_round,
+            num_results=len(results),
+            num_failures=len(failures),
+            num_dropped=len(self.dropped),
+            dropped=self.dropped,
+            bytes_up=self.bytes_up,
+            bytes_up_dense=self.model_bytes * len(results),
+            bytes_down=self.bytes_down,
+            **metrics_aggregated,
+        )
+        self.dropped = []
+        self.save_checkpoint(server_round, parameters_aggregated)
+        self.record_fit_round(server_round)
 
         # Return the expected outputs for `aggregate_fit`
         return parameters_aggregated, metrics_aggregated
 
+    def configure_evaluate(
+        self, server_round: int, parameters: Parameters, client_manager: ClientManager
+    ):
+        """Configure the next round of evaluation, or evaluate on behalf of the clients."""
+        if not self.batched_client_eval:
+            return super().configure_evaluate(server_round, parameters, client_manager)
+        self.evaluate_clients_batched(server_round, parameters, client_manager.num_available())
+        # No ClientApp is left to sample for evaluation
+        return []
+
+    def evaluate_clients_batched(
+        self, server_round: int, parameters: Parameters, num_partitions: int
+    ) -> tuple[float, dict[str, bool | bytes | float | int | str]]:
+        """Evaluate the global model on the validation sets of all partitions in one pass.
+
+        All clients would evaluate the same global model, so instead of N small
+        evaluations the validation sets are concatenated and evaluated together. The
+        results are split back per client and aggregated as `aggregate_evaluate` does.
+        """
+        if self.client_valsets is None or len(self.client_valsets[2]) != num_partitions:
+            valsets = [
+                load_partition(pid, num_partitions, self.partitioning)["test"]
+                for pid in range(num_partitions)
+            ]
+            self.client_valsets = (
+                torch.cat([images for images, _ in valsets]),
+                torch.cat([labels for _, labels in valsets]),
+                [len(labels) for _, labels in valsets],
+            )
+        images, labels, sizes = self.client_valsets
+
+        with activate(self.tracer, round=server_round), span("evaluate_clients"):
+            set_weights(self.client_eval_model, parameters_to_ndarrays(parameters))
+            per_client = test_shards(self.client_eval_model, images, labels, sizes, device="cpu")
+
+        loss = weighted_loss_avg([(size, loss) for size, (loss, _) in zip(sizes, per_client)])
+        metrics = {}
+        if self.evaluate_metrics_aggregation_fn:
+            metrics = self.evaluate_metrics_aggregation_fn(
+                [(size, {"accuracy": accuracy}) for size, (_, accuracy) in zip(sizes, per_client)]
+            )
+        self.metrics_log.log(
+            event="evaluate_clients", round=server_round, loss=loss, **metrics
+        )
+        return loss, metrics
+
+    def aggregate_evaluate(
+        self,
+        server_round: int,
+        results: list[tuple[ClientProxy, EvaluateRes]],
+        failures: list[tuple[ClientProxy, EvaluateRes] | BaseException],
+    ) -> tuple[float | None, dict[str, bool | bytes | float | int | str]]:
+        """Aggregate evaluation results from the clients and record them."""
+        for client, evaluate_res in results:
+            self.learn_partition(client, evaluate_res)
+        loss, metrics = super().aggregate_evaluate(server_round, results, failures)
+        self.metrics_log.log(
+            event="evaluate_clients", round=server_round, loss=loss, **metrics
+        )
+        return loss, metrics
+
     def evaluate(
         self, server_round: int, parameters: Parameters
     ) -> tuple[float, dict[str, bool | bytes | float | int | str]] | None:
-        """Evaluate global model, then save metrics to local JSON and to W&B."""
+        """Evaluate global model, then save metrics to the local records and the tracker."""
         # Call the default behaviour from FedAvg
-        loss, metrics = super().evaluate(server_round, parameters)
+        with activate(self.tracer, round=server_round), span("evaluate"):
+            loss, metrics = super().evaluate(server_round, parameters)
 
         # Store metrics as dictionary
         my_results = {"loss": loss, **metrics}
-        # Insert into local dictionary
-        self.results_to_save[server_round] = my_results
+        # Append them to the records of the run (with the time, to measure time-to-accuracy)
+        self.metrics_log.log(event="evaluate", round=server_round, time=time.time(), **my_results)
 
-        # Save metrics as json
-        with open("results.json", "w") as json_file:
-            json.dump(self.results_to_save, json_file, indent=4)
-
-        # Log metrics to W&B
-        wandb.log(my_results, step=server_round)
+        # Log metrics to the tracker
+        self.tracker.log(my_results, step=server_round)
 
         # Return the expected outputs for `evaluate`
-        return loss, metrics
\ No newline at end of file
+        return loss, metrics
+
+    def close(self) -> None:
+        """Flush pending checkpoints, close the tracker and write the trace of the run."""
+        atexit.unregister(self.close)
+        self.checkpoints.close()
+        self.tracker.close()
+        if self.tracer is not None:
+            write_chrome_trace(self.run_dir)
+
+
+class FedBuff(CustomFedAvg):
+    """Buffered asynchronous aggregation (FedBuff), run by a `BufferedServer`.
+
+    Clients don't train in lockstep: the server keeps clients training at all times
+    and the global model is updated as soon as `buffer_size` updates have arrived, so
+    a slow client no longer holds up everyone else. Its update is applied when it
+    arrives, as the delta to the global model it trained from, weighted by
+    `(1 + staleness) ** -staleness_exponent` where `staleness` is the number of
+    updates of the global model since it was sent to the client.
+
+    Each update of the global model counts as a round: it's evaluated, recorded and
+    checkpointed like a round of `CustomFedAvg`.
+    """
+
+    def __init__(self, *args, buffer_size=2, staleness_exponent=0.5, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buffer_size = buffer_size
+        self.staleness_exponent = staleness_exponent
+        # Global models clients are training from, by version (the round they follow)
+        self.versions = {}
+
+    def configure_dispatch(
+        self, version: int, parameters: Parameters, clients: list[ClientProxy]
+    ) -> list[tuple[ClientProxy, FitIns]]:
+        """Instructions to train `clients` from the global model of `version`."""
+        if version not in self.versions:
+            self.versions[version] = parameters_to_ndarrays(parameters)
+        self.model_bytes = payload_bytes(parameters.tensors)
+        self.bytes_down += self.model_bytes * len(clients)
+        config = {}
+        if self.on_fit_config_fn is not None:
+            config = self.on_fit_config_fn(version + 1)
+        fit_ins = FitIns(parameters, config)
+        return [(client, fit_ins) for client in clients]
+
+    def forget_versions(self, in_use: set[int]) -> None:
+        """Drop the global models no client is training from anymore."""
+        latest = max(self.versions, default=0)
+        for version in list(self.versions):
+            if version not in in_use and version != latest:
+                del self.versions[version]
+
+    def staleness_weight(self, staleness: int) -> float:
+        return (1 + staleness) ** -self.staleness_exponent
+
+    def aggregate_buffer(
+        self,
+        server_round: int,
+        buffer: list[tuple[ClientProxy, FitRes, int]],
+        failures: list[tuple[ClientProxy, FitRes] | BaseException],
+    ) -> tuple[Parameters, dict[str, bool | bytes | float | int | str]]:
+        """Apply the buffered `(client, result, version)` updates to the global model.
+
+        `version` is that of the global model the client trained from, the result
+        becomes version `server_round`.
+        """
+        current = self.versions[server_round - 1]
+        bytes_up = sum(payload_bytes(fit_res.parameters.tensors) for _, fit_res, _ in buffer)
+        average = WeightedAverage()
+        staleness = []
+        with activate(self.tracer, round=server_round), span("aggregation", num_results=len(buffer)):
+            for _, fit_res, version in buffer:
+                reference = self.versions[version]
+                weights = self.decode_update(fit_res, reference)
+                staleness.append(server_round - 1 - version)
+                weight = self.staleness_weight(staleness[-1])
+                average.add(
+                    [weight * (w - r) for w, r in zip(weights, reference)], fit_res.num_examples
+                )
+                fit_res.parameters.tensors.clear()
+            ndarrays = [array + delta for array, delta in zip(current, average.result())]
+        self.versions[server_round] = ndarrays
+        parameters = ndarrays_to_parameters(ndarrays)
+
+        results = [(client, fit_res) for client, fit_res, _ in buffer]
+        metrics_aggregated = self.aggregate_fit_metrics(server_round, results)
+        self.metrics_log.log(
+            event="fit",
+            round=server_round,
+            num_results=len(buffer),
+            num_failures=len(failures),
+            staleness_mean=sum(staleness) / len(staleness),
+            staleness_max=max(staleness),
+            bytes_up=bytes_up,
+            bytes_up_dense=self.model_bytes * len(buffer),
+            bytes_down=self.bytes_down,
+            **metrics_aggregated,
+        )
+        self.bytes_down = 0
+        self.save_checkpoint(server_round, parameters)
+        return parameters, metrics_aggregated
\ No newline at end of file
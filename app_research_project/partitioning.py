@@ -0,0 +1,187 @@
+"""my-awesome-app: Divide the train split of FashionMNIST between the clients."""
+
+import math
+from dataclasses import dataclass
+
+import numpy as np
+
+PARTITIONERS = ("dirichlet", "label-group", "pathological")
+
+# Seed of the shuffle and of the 80/20 split `FederatedDataset` used to apply
+SPLIT_SEED = 42
+TEST_SIZE = 0.2
+
+# Smallest partition a Dirichlet draw is accepted with, and the draws tried for it
+MIN_PARTITION_SIZE = 10
+MAX_DIRICHLET_ATTEMPTS = 11
+
+
+@dataclass(frozen=True)
+class Partitioning:
+    """How the train split is divided between `num_partitions` clients.
+
+    - `"dirichlet"`: the classes of each client follow a Dirichlet distribution of
+      concentration `alpha` (lower is more non-IID), drawn like `DirichletPartitioner`.
+    - `"label-group"`: `label_groups` lists groups of classes (e.g. `"0,1|2,3"`). The
+      clients are assigned to the groups round-robin and the clients of a group split
+      its examples evenly; with fewer clients than groups, a client takes several.
+    - `"pathological"`: each client holds `classes_per_partition` classes (drawn with
+      `seed`) and the clients holding a class split its examples evenly.
+
+    `seed` seeds the partitioner. Whatever the partitioner, each partition is then
+    divided into 80% train and 20% test.
+    """
+
+    partitioner: str = "dirichlet"
+    alpha: float = 1.0
+    seed: int = 42
+    label_groups: str = "0,1,2|3,4,5|6,7|8,9"
+    classes_per_partition: int = 2
+
+    def __post_init__(self):
+        if self.partitioner not in PARTITIONERS:
+            raise ValueError(f"Unknown partitioner '{self.partitioner}' (expected one of {PARTITIONERS})")
+
+    @classmethod
+    def from_run_config(cls, run_config) -> "Partitioning":
+        return cls(
+            partitioner=run_config["partitioner"],
+            alpha=run_config["partition-alpha"],
+            seed=run_config["seed"],
+            label_groups=run_config["label-groups"],
+            classes_per_partition=run_config["classes-per-partition"],
+        )
+
+    def key(self, num_partitions: int) -> str:
+        """Name identifying the partitioning in the partition store.
+
+        Only the parameters the partitioner uses are part of it, so e.g. sweeping
+        `alpha` doesn't recompute the label-group partitions.
+        """
+        if self.partitioner == "dirichlet":
+            params = f"alpha{self.alpha}"
+        elif self.partitioner == "label-group":
+            params = self.label_groups.replace(" ", "").replace(",", ".").replace("|", "_")
+        else:
+            params = f"k{self.classes_per_partition}"
+        return f"{self.partitioner}-{params}-n{num_partitions}-seed{self.seed}"
+
+    def groups(self) -> list[list[int]]:
+        """The classes of each group of `label_groups`."""
+        return [[int(c) for c in group.split(",")] for group in self.label_groups.split("|")]
+
+
+def dirichlet_rows(labels, num_partitions, alpha, seed) -> list[np.ndarray]:
+    """Rows of each partition, drawn as `DirichletPartitioner` of flwr-datasets does.
+
+    For every class, the fractions of its examples each partition gets are drawn from
+    a symmetric Dirichlet distribution, and the draw is repeated until every partition
+    has `MIN_PARTITION_SIZE` examples. The same seed gives the same partitions as
+    flwr-datasets, and like it a `ValueError` is raised when no draw succeeds within
+    `MAX_DIRICHLET_ATTEMPTS` (e.g. with a very low `alpha` and many partitions).
+    """
+    rng = np.random.default_rng(seed)
+    concentration = np.full(num_partitions, float(alpha))
+    class_rows = [np.flatnonzero(labels == label) for label in np.unique(labels)]
+    for attempt in range(MAX_DIRICHLET_ATTEMPTS):
+        chunks = [[] for _ in range(num_partitions)]
+        for rows in class_rows:
+            proportions = rng.dirichlet(concentration)
+            bounds = (np.cumsum(proportions) * len(rows)).astype(int)[:-1]
+            for partition_id, part in enumerate(np.split(rows, bounds)):
+                chunks[partition_id].append(part)
+        partitions = [np.concatenate(c) for c in chunks]
+        if min(len(p) for p in partitions) >= MIN_PARTITION_SIZE:
+            break
+    else:
+        raise ValueError(
+            f"No Dirichlet draw (alpha={alpha}) gave all {num_partitions} partitions at "
+            f"least {MIN_PARTITION_SIZE} examples in {MAX_DIRICHLET_ATTEMPTS} attempts; "
+            "use a higher alpha, fewer partitions or another seed"
+        )
+    for rows in partitions:
+        rng.shuffle(rows)
+    return partitions
+
+
+def split_classes(labels, holders, num_partitions, rng) -> list[np.ndarray]:
+    """Give the examples of each class to its `holders`, shuffled and split evenly.
+
+    `holders[c]` lists the partitions holding class `c`; a class without any is left
+    out. Returns the rows of each partition.
+    """
+    chunks = [[] for _ in range(num_partitions)]
+    for label, partitions in enumerate(holders):
+        if not len(partitions):
+            continue
+        rows = rng.permutation(np.flatnonzero(labels == label))
+        for partition_id, part in zip(partitions, np.array_split(rows, len(partitions))):
+            chunks[partition_id].append(part)
+    return [np.concatenate(c) if c else np.zeros(0, dtype=np.int64) for c in chunks]
+
+
+def label_group_rows(labels, num_partitions, groups, seed) -> list[np.ndarray]:
+    """Rows of each partition when clients are assigned to groups of classes."""
+    num_classes = int(labels.max()) + 1
+    holders = [[] for _ in range(num_classes)]
+    if num_partitions >= len(groups):
+        partition_groups = [[p % len(groups)] for p in range(num_partitions)]
+    else:
+        partition_groups = [list(range(p, len(groups), num_partitions)) for p in range(num_partitions)]
+    for partition_id, group_ids in enumerate(partition_groups):
+        for group_id in group_ids:
+            for label in groups[group_id]:
+                holders[label].append(partition_id)
+    return split_classes(labels, holders, num_partitions, np.random.default_rng(seed))
+
+
+def pathological_rows(labels, num_partitions, classes_per_partition, seed) -> list[np.ndarray]:
+    """Rows of each partition when every client holds `classes_per_partition` classes.
+
+    The classes are dealt in a random order (drawn with `seed`) so that each of them is
+    held by as many clients as possible: client `i` takes the classes at positions
+    `i * k ... i * k + k - 1` (mod the number of classes) of that order.
+    """
+    rng = np.random.default_rng(seed)
+    num_classes = int(labels.max()) + 1
+    order = rng.permutation(num_classes)
+    positions = np.arange(num_partitions)[:, None] * classes_per_partition + np.arange(
+        min(classes_per_partition, num_classes)
+    )
+    partition_classes = order[positions % num_classes]
+    holders = [np.flatnonzero((partition_classes == label).any(axis=1)) for label in range(num_classes)]
+    return split_classes(labels, holders, num_partitions, rng)
+
+
+def train_test_rows(rows: np.ndarray) -> dict[str, np.ndarray]:
+    """Divide the rows of a partition 80/20 like `Dataset.train_test_split(seed=42)`."""
+    permutation = np.random.default_rng(SPLIT_SEED).permutation(len(rows))
+    num_test = math.ceil(TEST_SIZE * len(rows))
+    return {"train": rows[permutation[num_test:]], "test": rows[permutation[:num_test]]}
+
+
+def compute_partition_index(
+    labels: np.ndarray, num_partitions: int, partitioning: Partitioning
+) -> dict[str, np.ndarray]:
+    """Rows of the train split that make up the train and test split of every partition.
+
+    As `FederatedDataset` did, the split is shuffled (seed 42) before it is partitioned.
+    The rows of partition `i` are `{split}_rows[{split}_offsets[i]:{split}_offsets[i + 1]]`,
+    stored as int32.
+    """
+    shuffle = np.random.default_rng(SPLIT_SEED).permutation(len(labels))
+    shuffled = labels[shuffle]
+    if partitioning.partitioner == "dirichlet":
+        rows = dirichlet_rows(shuffled, num_partitions, partitioning.alpha, partitioning.seed)
+    elif partitioning.partitioner == "label-group":
+        rows = label_group_rows(shuffled, num_partitions, partitioning.groups(), partitioning.seed)
+    else:
+        rows = pathological_rows(
+            shuffled, num_partitions, partitioning.classes_per_partition, partitioning.seed
+        )
+    splits = [train_test_rows(shuffle[r]) for r in rows]
+    index = {}
+    for split in ("train", "test"):
+        index[f"{split}_rows"] = np.concatenate([s[split] for s in splits]).astype(np.int32)
+        index[f"{split}_offsets"] = np.cumsum([0] + [len(s[split]) for s in splits], dtype=np.int64)
+    return index
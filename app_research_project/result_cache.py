@@ -0,0 +1,137 @@
+"""my-awesome-app: Content-addressed cache of sweep results."""
+
+import hashlib
+import json
+import os
+from dataclasses import asdict
+from functools import lru_cache
+from pathlib import Path
+
+from flwr.common.config import flatten_dict, get_fused_config_from_dir
+
+from app_research_project.sweep import PROJECT_DIR, CellResult, SweepCell, load_federation
+
+# Default location of the cached results and sweep manifests
+CACHE_DIR = PROJECT_DIR / "results" / "cache"
+
+
+@lru_cache(maxsize=None)
+def code_version() -> str:
+    """Hash of the sources of the Flower App.
+
+    Any change to the code running a simulation produces a new version, so results
+    computed with older code are never mistaken for current ones.
+    """
+    digest = hashlib.sha256()
+    for path in sorted((PROJECT_DIR / "app_research_project").glob("*.py")):
+        digest.update(path.name.encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def cell_key(cell: SweepCell) -> str:
+    """Return the key identifying the results of `cell`.
+
+    It's a hash of the fused run config, the options of the federation, the number
+    of SuperNodes, the engine, the code version and the seed. `tags` only label the
+    cell in the outputs and don't take part in the key.
+    """
+    run_config = get_fused_config_from_dir(PROJECT_DIR, flatten_dict(cell.run_config))
+    # The run directory changes on every run without affecting the results
+    run_config.pop("run-dir", None)
+    identity = {
+        "run_config": run_config,
+        "federation": load_federation(cell.federation),
+        "num_supernodes": cell.num_supernodes,
+        "engine": cell.engine,
+        "code_version": code_version(),
+        "seed": run_config.get("seed"),
+    }
+    return hashlib.sha256(json.dumps(identity, sort_keys=True).encode()).hexdigest()
+
+
+def _write_json(path: Path, payload) -> None:
+    """Write `payload` to `path` atomically, so an interrupted sweep never leaves a partial file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2)
+    os.replace(tmp, path)
+
+
+def _from_dict(payload: dict) -> CellResult:
+    payload = dict(payload)
+    cell = SweepCell(**payload.pop("cell"))
+    # JSON object keys are strings, rounds are indexed by int
+    rounds = {int(k): v for k, v in payload.pop("rounds").items()}
+    return CellResult(cell=cell, rounds=rounds, **payload)
+
+
+class ResultCache:
+    """Store the `CellResult` of each completed cell under its `cell_key`.
+
+    Results live in `<root>/<key>.json` and sweeps in `<root>/sweeps/<name>.json`,
+    a manifest listing the keys of their cells. Only successful cells are cached,
+    so failed or timed out ones run again on the next invocation.
+    """
+
+    def __init__(self, root=CACHE_DIR):
+        self.root = Path(root)
+
+    def key(self, cell: SweepCell) -> str:
+        return cell_key(cell)
+
+    def path(self, key: str) -> Path:
+        return self.root / f"{key}.json"
+
+    def get(self, key: str) -> CellResult | None:
+        """Return the cached result stored under `key` (if any)."""
+        path = self.path(key)
+        if not path.exists():
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return _from_dict(json.load(f))
+
+    def put(self, key: str, result: CellResult) -> None:
+        """Persist `result` under `key` if its cell completed successfully."""
+        if result.status == "ok":
+            _write_json(self.path(key), asdict(result))
+
+    def save_sweep(self, name: str, cells: list[SweepCell]) -> None:
+        """Record which cells make up the sweep `name`."""
+        keys = [cell_key(cell) for cell in cells]
+        _write_json(self.root / "sweeps" / f"{name}.json", keys)
+
+    def load_sweep(self, name: str) -> list[CellResult]:
+        """Return the cached results of the sweep `name`, in cell order.
+
+        Cells without a cached result (e.g. still running or failed) are left out,
+        and an unknown sweep returns an empty list.
+        """
+        path = self.root / "sweeps" / f"{name}.json"
+        if not path.exists():
+            return []
+        with open(path, "r", encoding="utf-8") as f:
+            keys = json.load(f)
+        results = [self.get(key) for key in keys]
+        return [result for result in results if result is not None]
+
+
+def summary_rows(results: list[CellResult]) -> list[dict]:
+    """One row per cell: its tags, status and final metrics."""
+    return [
+        {
+            "timestamp": result.finished_at,
+            **result.cell.tags,
+            "status": result.status,
+            "final_accuracy": result.final_accuracy,
+            "final_loss": result.final_loss,
+            "error": result.error,
+        }
+        for result in results
+    ]
+
+
+def round_rows(results: list[CellResult]) -> list[dict]:
+    """One row per cell and round: its tags, accuracy and loss."""
+    return [{**result.cell.tags, **row} for result in results for row in result.round_rows()]
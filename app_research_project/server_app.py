@@ -3,22 +3,37 @@
 import json
 from typing import List, Tuple
 
-from datasets import load_dataset
 from flwr.common import Context, Metrics, ndarrays_to_parameters
-from flwr.server import ServerApp, ServerAppComponents, ServerConfig
-from torch.utils.data import DataLoader
+from flwr.server import ServerApp, ServerAppComponents, ServerConfig, SimpleClientManager
 
-from app_research_project.my_strategy import CustomFedAvg
-from app_research_project.task import Net, get_transforms, get_weights, set_weights, test
+from app_research_project.buffered_server import BufferedServer
+from app_research_project.compression import UpdateCodec
+from app_research_project.deadline_server import DeadlineServer
+from app_research_project.data_store import load_testset
+from app_research_project.metrics_log import get_run_dir
+from app_research_project.partitioning import Partitioning
+from app_research_project.my_strategy import (
+    CustomFedAvg,
+    FedBuff,
+    make_client_selector,
+    make_tracker,
+)
+from app_research_project.task import Net, TensorLoader, get_weights, set_weights, test
+
+
+testset = None  # Cache global test set (pre-decoded images and labels)
+
+# The whole test set (10k images) is evaluated in a single forward pass
+EVAL_BATCH_SIZE = 10_000
 
 
 def get_evaluate_fn(testloader, device):
     """Return a callback that evaluates the global model."""
+    # Instantiate model once, every round only loads the new parameters into it
+    net = Net()
 
     def evaluate(server_round, parameters_ndarrays, config):
         """Evaluate global model using provided centralised testset."""
-        # Instantiate model
-        net = Net()
         # Apply global_model parameters
         set_weights(net, parameters_ndarrays)
         net.to(device)
@@ -62,7 +77,12 @@ def on_fit_config(server_round: int) -> Metrics:
     # Appply a simple learning rate decay
     if server_round > 2:
         lr = 0.005
-    return {"lr": lr}
+    return {"lr": lr, "server_round": server_round}
+
+
+def on_evaluate_config(server_round: int) -> Metrics:
+    """Let the ClientApps know which round they are evaluating."""
+    return {"server_round": server_round}
 
 
 def server_fn(context: Context):
@@ -75,13 +95,27 @@ def server_fn(context: Context):
     ndarrays = get_weights(Net())
     parameters = ndarrays_to_parameters(ndarrays)
 
-    # Load global test set
-    testset = load_dataset("zalando-datasets/fashion_mnist")["test"]
+    # Load global test set only once per process
+    global testset
+    if testset is None:
+        testset = load_testset()
     # Construct dataloader
-    testloader = DataLoader(testset.with_transform(get_transforms()), batch_size=32)
-
-    # Define strategy
-    strategy = CustomFedAvg(
+    testloader = TensorLoader(*testset, batch_size=EVAL_BATCH_SIZE)
+
+    # Define strategy: synchronous rounds, or FedBuff (asynchronous, buffered updates)
+    aggregation = context.run_config["aggregation"]
+    if aggregation == "sync":
+        strategy_cls, strategy_kwargs = CustomFedAvg, {}
+    elif aggregation == "fedbuff":
+        strategy_cls = FedBuff
+        strategy_kwargs = {
+            "buffer_size": context.run_config["buffer-size"],
+            "staleness_exponent": context.run_config["staleness-exponent"],
+        }
+    else:
+        raise ValueError(f"Unknown aggregation '{aggregation}' (expected 'sync' or 'fedbuff')")
+    run_dir = get_run_dir(context)
+    strategy = strategy_cls(
         fraction_fit=fraction_fit,
         fraction_evaluate=1.0,  # All nodes are sampled for evaluation
         min_available_clients=2,
@@ -89,11 +123,38 @@ def server_fn(context: Context):
         evaluate_metrics_aggregation_fn=weighted_average,
         fit_metrics_aggregation_fn=handle_fit_metrics,
         on_fit_config_fn=on_fit_config,
+        on_evaluate_config_fn=on_evaluate_config,
         evaluate_fn=get_evaluate_fn(testloader, device="cpu"),
+        run_dir=run_dir,
+        metrics_fsync=context.run_config["metrics-fsync"],
+        batched_client_eval=context.run_config["batched-client-eval"],
+        checkpoint_keep_last=context.run_config["checkpoint-keep-last"],
+        checkpoint_every=context.run_config["checkpoint-every"],
+        tracker=make_tracker(context.run_config["tracker"], run_dir),
+        update_codec=UpdateCodec.from_run_config(context.run_config),
+        oversample=context.run_config["oversample"],
+        client_selector=make_client_selector(context.run_config),
+        timing=context.run_config["timing"],
+        partitioning=Partitioning.from_run_config(context.run_config),
+        **strategy_kwargs,
     )
     config = ServerConfig(num_rounds=num_rounds)
 
-    return ServerAppComponents(strategy=strategy, config=config)
+    if aggregation == "fedbuff":
+        server = BufferedServer(
+            client_manager=SimpleClientManager(),
+            strategy=strategy,
+            concurrency=context.run_config["max-concurrency"],
+        )
+        return ServerAppComponents(server=server, strategy=strategy, config=config)
+    # Updates are aggregated as they arrive. Rounds end at their deadline, or once enough
+    # of the (over-sampled) clients replied
+    server = DeadlineServer(
+        client_manager=SimpleClientManager(),
+        strategy=strategy,
+        deadline=context.run_config["round-deadline"],
+    )
+    return ServerAppComponents(server=server, strategy=strategy, config=config)
 
 
 # Create ServerApp
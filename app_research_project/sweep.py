@@ -0,0 +1,462 @@
+"""my-awesome-app: Run a grid of simulations inside long-lived processes."""
+
+import itertools
+import logging
+import math
+import multiprocessing
+import os
+import time
+import traceback
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from queue import Empty
+
+from flwr.client import ClientApp
+from flwr.common import Context, RecordDict
+from flwr.common.config import flatten_dict, get_fused_config_from_dir, get_project_config
+from flwr.common.constant import RUN_ID_NUM_BYTES, SUPERLINK_NODE_ID, TASK_ID_NUM_BYTES
+from flwr.server import ServerApp
+from flwr.server.superlink.linkstate.utils import generate_rand_int_from_bytes
+from flwr.simulation.run_simulation import _run_simulation
+from flwr.supercore.constant import DEFAULT_SIMULATION_CONFIG, NOOP_FEDERATION_ID
+from flwr.supercore.run import Run
+from flwr.supercore.task_identity import TaskIdentity
+from flwr.supercore.telemetry import EventType
+
+from app_research_project.batched_train import run_stacked_simulation
+from app_research_project.client_app import client_fn
+from app_research_project.data_store import load_partition_index
+from app_research_project.metrics_log import round_metrics
+from app_research_project.partitioning import Partitioning
+from app_research_project.server_app import server_fn
+
+# Directory holding the `pyproject.toml` of this Flower App
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+# Most workers a pool sized from the CPUs gets: each of them starts its own Ray cluster
+MAX_AUTO_WORKERS = 4
+
+
+@dataclass
+class SweepCell:
+    """A single simulation of a sweep.
+
+    `run_config` holds the overrides that `flwr run --run-config` would receive and
+    `tags` the values identifying the cell in the output CSVs (e.g. `num_clients`).
+    `engine` selects how the ClientApps are simulated: `"flower"` runs each of them in
+    the Ray backend, `"vmap"` trains all sampled clients at once in this process (see
+    `batched_train.run_stacked_simulation`).
+    """
+
+    run_config: dict
+    num_supernodes: int
+    federation: str = "local-simulation"
+    tags: dict = field(default_factory=dict)
+    engine: str = "flower"
+
+
+@dataclass
+class CellResult:
+    """Outcome of a `SweepCell`: its status and the metrics recorded on each round."""
+
+    cell: SweepCell
+    status: str
+    run_dir: str = ""
+    rounds: dict[int, dict] = field(default_factory=dict)
+    error: str | None = None
+    duration: float = 0.0
+    attempts: int = 1
+    finished_at: str = field(default_factory=lambda: datetime.now().isoformat())
+
+    @property
+    def final_accuracy(self):
+        """Centralised accuracy of the last round (if any)."""
+        if not self.rounds:
+            return None
+        return self.rounds[max(self.rounds)].get("cen_accuracy")
+
+    @property
+    def final_loss(self):
+        """Centralised loss of the last round (if any)."""
+        if not self.rounds:
+            return None
+        return self.rounds[max(self.rounds)].get("loss")
+
+    def round_rows(self):
+        """Return one `{round, accuracy, loss, bytes_up, bytes_down, round_time, dropped}`
+        dict per round, in round order. The bytes are those the clients and the server
+        sent in the round, `round_time` its wall time in seconds and `dropped` the number
+        of clients the server stopped waiting for."""
+        rows, previous = [], None
+        for server_round, metrics in sorted(self.rounds.items()):
+            round_time = None
+            if previous is not None and "time" in metrics and "time" in previous:
+                round_time = metrics["time"] - previous["time"]
+            rows.append(
+                {
+                    "round": server_round,
+                    "accuracy": metrics.get("cen_accuracy"),
+                    "loss": metrics.get("loss"),
+                    "bytes_up": metrics.get("bytes_up"),
+                    "bytes_down": metrics.get("bytes_down"),
+                    "round_time": round_time,
+                    "dropped": metrics.get("num_dropped"),
+                }
+            )
+            previous = metrics
+        return rows
+
+
+def grid(**axes):
+    """Return the cartesian product of the given axes as a list of dictionaries.
+
+    `grid(num_clients=[5, 10], seed=[0, 1])` yields the four combinations in the same
+    order the nested `for` loops of the runner scripts would visit them.
+    """
+    keys = list(axes)
+    return [dict(zip(keys, values)) for values in itertools.product(*axes.values())]
+
+
+def load_federation(name: str) -> dict:
+    """Read the options of a federation declared in the `pyproject.toml`."""
+    federations = get_project_config(PROJECT_DIR)["tool"]["flwr"]["federations"]
+    if name not in federations:
+        raise ValueError(f"Federation '{name}' is not defined in pyproject.toml")
+    return federations[name].get("options", {})
+
+
+def client_num_cpus(federation: str) -> float:
+    """Number of CPUs each simulated client of a federation reserves."""
+    resources = load_federation(federation).get("backend", {}).get("client-resources", {})
+    return resources.get("num-cpus", DEFAULT_SIMULATION_CONFIG.client_resources_num_cpus)
+
+
+def _new_run(override_config: dict) -> Run:
+    """Create a `Run` carrying `override_config`, like `flwr run --run-config` does.
+
+    The simulated SuperNodes fuse these overrides with the `[tool.flwr.app.config]`
+    section of the `pyproject.toml` when building the `Context` of each ClientApp.
+    """
+    run = Run.create_empty(run_id=generate_rand_int_from_bytes(RUN_ID_NUM_BYTES))
+    run.override_config = override_config
+    run.primary_task_id = generate_rand_int_from_bytes(TASK_ID_NUM_BYTES)
+    run.federation_id = NOOP_FEDERATION_ID
+    TaskIdentity.task_id = 1
+    TaskIdentity.run_id = run.run_id
+    TaskIdentity.node_id = SUPERLINK_NODE_ID
+    return run
+
+
+@contextmanager
+def _persistent_ray():
+    """Keep the Ray backend alive between the simulations of a sweep.
+
+    Every call to `run_simulation` terminates the Ray backend once the run completes,
+    so the next run pays the full Ray startup again. Inside this context manager only
+    the actors of each run are terminated, and the runtime is shut down on exit.
+    """
+    import ray
+    from flwr.server.superlink.fleet.vce.backend.raybackend import RayBackend
+
+    terminate = RayBackend.terminate
+
+    def terminate_actors(self):
+        if self.pool:
+            self.pool.terminate_all_actors()
+
+    RayBackend.terminate = terminate_actors
+    try:
+        yield
+    finally:
+        RayBackend.terminate = terminate
+        if ray.is_initialized():
+            ray.shutdown()
+
+
+def run_cell(cell: SweepCell, output_dir="runs", num_cpus=None) -> CellResult:
+    """Run the simulation described by `cell` in the current process.
+
+    The outputs of the run (metrics records, checkpoints) are written to a directory
+    named after the run id inside `output_dir`. `num_cpus` caps the CPUs the Ray
+    backend may use when it's started by this cell.
+
+    When a simulation fails, Flower leaves its ServerApp thread waiting on the grid, so
+    the process can't exit: run cells in a worker process (see `SweepScheduler`).
+    """
+    options = load_federation(cell.federation)
+    backend_config = options.get("backend", {})
+    if num_cpus is not None:
+        backend_config.setdefault("init-args", {})["num-cpus"] = num_cpus
+    run = _new_run(flatten_dict(cell.run_config))
+    run_dir = Path(output_dir).resolve() / str(run.run_id)
+    run.override_config["run-dir"] = str(run_dir)
+    server_context = Context(
+        run_id=run.run_id,
+        node_id=SUPERLINK_NODE_ID,
+        node_config={},
+        state=RecordDict(),
+        run_config=get_fused_config_from_dir(PROJECT_DIR, run.override_config),
+    )
+
+    # Keep a handle on the strategy so its metrics can be read once the run is over
+    captured = {}
+
+    def capturing_server_fn(context: Context):
+        components = server_fn(context)
+        captured["strategy"] = components.strategy
+        return components
+
+    start = time.perf_counter()
+    try:
+        # Partition the dataset first: a partitioning that can't be drawn (see
+        # `dirichlet_rows`) fails the cell with its error, rather than every ClientApp
+        partitioning = Partitioning.from_run_config(server_context.run_config)
+        load_partition_index(cell.num_supernodes, partitioning)
+        if cell.engine == "vmap":
+            run_stacked_simulation(server_context.run_config, cell.num_supernodes)
+        else:
+            _run_simulation(
+                num_supernodes=cell.num_supernodes,
+                exit_event=EventType.PYTHON_API_RUN_SIMULATION_LEAVE,
+                client_app=ClientApp(client_fn=client_fn),
+                server_app=ServerApp(server_fn=capturing_server_fn),
+                backend_config=backend_config,
+                server_app_context=server_context,
+                app_dir=str(PROJECT_DIR),
+                run=run,
+                is_app=True,
+            )
+    except Exception:  # pylint: disable=broad-exception-caught
+        return CellResult(
+            cell=cell,
+            status="failed",
+            run_dir=str(run_dir),
+            error=traceback.format_exc()[-500:],
+            duration=time.perf_counter() - start,
+        )
+    finally:
+        if "strategy" in captured:
+            captured["strategy"].close()
+
+    rounds = round_metrics(run_dir)
+    for server_round, metrics in round_metrics(run_dir, event="fit").items():
+        keys = ("bytes_up", "bytes_down", "num_dropped")
+        fit_record = {key: metrics[key] for key in keys if key in metrics}
+        rounds.setdefault(server_round, {}).update(fit_record)
+    return CellResult(
+        cell=cell,
+        status="ok",
+        run_dir=str(run_dir),
+        rounds=rounds,
+        duration=time.perf_counter() - start,
+    )
+
+
+def _worker_main(worker_id, task_queue, result_queue, output_dir, log_level, num_cpus):
+    """Run the cells received through `task_queue` until a `None` arrives."""
+    logging.getLogger("flwr").setLevel(log_level)
+    with _persistent_ray():
+        while (task := task_queue.get()) is not None:
+            key, cell = task
+            result_queue.put((worker_id, key, run_cell(cell, output_dir, num_cpus)))
+
+
+class _Worker:
+    """A worker process of the `SweepScheduler` and the cell it's running."""
+
+    def __init__(self, worker_id, ctx, result_queue, worker_args):
+        self.task_queue = ctx.Queue()
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(worker_id, self.task_queue, result_queue, *worker_args),
+        )
+        self.process.start()
+        self.task = None
+        self.started = 0.0
+
+    @property
+    def key(self):
+        """Identify the current task by its cell index and attempt number."""
+        return None if self.task is None else (self.task[0], self.task[2])
+
+    def submit(self, task):
+        self.task = task
+        self.started = time.monotonic()
+        self.task_queue.put((self.key, task[1]))
+
+    def stop(self, timeout=10.0):
+        if self.process.is_alive():
+            self.task_queue.put(None)
+            self.process.join(timeout)
+        self.kill()
+
+    def kill(self, timeout=5.0):
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+
+
+class SweepScheduler:
+    """Run independent sweep cells concurrently in a pool of worker processes.
+
+    Each worker is a long-lived process that runs its cells one after the other with
+    its own Ray backend, limited to `cpus_per_worker` CPUs. Unless `max_workers` is
+    given, the pool is sized so that all workers together use the CPUs of the machine,
+    up to `MAX_AUTO_WORKERS` workers. A cell taking longer than
+    `timeout` seconds gets its worker killed (and replaced), as does a cell that fails,
+    since the threads of its simulation may be left running. Failed or timed out cells
+    are retried up to `retries` times. Results are returned in cell order.
+    """
+
+    def __init__(
+        self,
+        max_workers=None,
+        cpus_per_worker=None,
+        timeout=None,
+        retries=0,
+        output_dir="runs",
+        log_level=logging.WARNING,
+    ):
+        self.max_workers = max_workers
+        self.cpus_per_worker = cpus_per_worker
+        self.timeout = timeout
+        self.retries = retries
+        self.output_dir = output_dir
+        self.log_level = log_level
+
+    def pool_size(self, cells: list[SweepCell]) -> tuple[int, int]:
+        """Return the number of workers and the CPUs each of them may use."""
+        cpus = self.cpus_per_worker
+        if cpus is None:
+            # Enough for one client of the most demanding federation in the sweep
+            cpus = max(client_num_cpus(cell.federation) for cell in cells)
+        # Ray only accepts a whole number of CPUs for its runtime
+        cpus = math.ceil(cpus)
+        workers = self.max_workers
+        if workers is None:
+            workers = min((os.cpu_count() or 1) // cpus, MAX_AUTO_WORKERS)
+        return max(1, min(workers, len(cells))), cpus
+
+    def run(self, cells: list[SweepCell], on_result=None) -> list[CellResult]:
+        """Run all `cells`, calling `on_result` as each of them completes."""
+        if not cells:
+            return []
+        num_workers, cpus = self.pool_size(cells)
+        ctx = multiprocessing.get_context("spawn")
+        result_queue = ctx.Queue()
+        worker_args = (self.output_dir, self.log_level, cpus)
+        workers = [_Worker(i, ctx, result_queue, worker_args) for i in range(num_workers)]
+
+        pending = [(index, cell, 1) for index, cell in enumerate(cells)]
+        pending.reverse()
+        results = [None] * len(cells)
+
+        def finish(worker, result):
+            index, cell, attempt = worker.task
+            worker.task = None
+            result.attempts = attempt
+            if result.status != "ok" and attempt <= self.retries:
+                pending.append((index, cell, attempt + 1))
+                return
+            results[index] = result
+            if on_result is not None:
+                on_result(result)
+
+        try:
+            while pending or any(w.task is not None for w in workers):
+                for worker in workers:
+                    if worker.task is None and pending:
+                        worker.submit(pending.pop())
+
+                try:
+                    worker_id, key, result = result_queue.get(timeout=1.0)
+                    worker = workers[worker_id]
+                    # Ignore results sent by a worker right before it was replaced
+                    if worker.key == key:
+                        finish(worker, result)
+                        if result.status != "ok":
+                            worker.kill()
+                            workers[worker_id] = _Worker(worker_id, ctx, result_queue, worker_args)
+                except Empty:
+                    pass
+
+                # Replace workers that exceeded the timeout or died
+                for i, worker in enumerate(workers):
+                    if worker.task is None:
+                        continue
+                    elapsed = time.monotonic() - worker.started
+                    timed_out = self.timeout is not None and elapsed > self.timeout
+                    if not timed_out and worker.process.is_alive():
+                        continue
+                    worker.kill()
+                    status = "timeout" if timed_out else "failed"
+                    error = "timeout" if timed_out else "worker process died"
+                    cell = worker.task[1]
+                    finish(worker, CellResult(cell, status, error=error, duration=elapsed))
+                    workers[i] = _Worker(i, ctx, result_queue, worker_args)
+        finally:
+            for worker in workers:
+                worker.stop()
+
+        return results
+
+
+def run_sweep(
+    cells: list[SweepCell],
+    on_result=None,
+    output_dir="runs",
+    log_level=logging.WARNING,
+    max_workers=1,
+    timeout=None,
+    retries=0,
+    cache=None,
+) -> list[CellResult]:
+    """Run every cell of a sweep, reusing imports, data and the Ray backend.
+
+    The cells run in the worker processes of a `SweepScheduler`: one by default, which
+    runs them one after the other, and `max_workers=None` sizes the pool from the
+    `num-cpus` client resources of the federations (up to `MAX_AUTO_WORKERS`). A failed simulation can't keep the
+    sweep from exiting, its worker is replaced. Scripts calling `run_sweep` must guard
+    their entry point with `if __name__ == "__main__":`.
+
+    `on_result` is called with each `CellResult` as soon as its cell completes, and
+    the results are returned in the order of `cells`. Since metrics are read from the
+    records of each run, the console output of Flower is reduced to `log_level` to
+    cut I/O during large sweeps.
+
+    With a `ResultCache`, cells whose result is already cached are not run again
+    (`on_result` still receives their cached result) and every cell is persisted
+    as soon as it completes, so an interrupted sweep resumes where it stopped.
+    """
+    cached = {}
+    if cache is not None:
+        for index, cell in enumerate(cells):
+            result = cache.get(cache.key(cell))
+            if result is not None:
+                cached[index] = result
+                if on_result is not None:
+                    on_result(result)
+
+    def completed(result):
+        if cache is not None:
+            cache.put(cache.key(result.cell), result)
+        if on_result is not None:
+            on_result(result)
+
+    missing = [cell for index, cell in enumerate(cells) if index not in cached]
+    scheduler = SweepScheduler(
+        max_workers=max_workers,
+        timeout=timeout,
+        retries=retries,
+        output_dir=output_dir,
+        log_level=log_level,
+    )
+    new_results = scheduler.run(missing, completed)
+
+    new_results = iter(new_results)
+    return [cached[index] if index in cached else next(new_results) for index in range(len(cells))]
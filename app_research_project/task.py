@@ -1,14 +1,20 @@
 """my-awesome-app: A Flower / PyTorch app."""
 
+import math
+import time
 from collections import OrderedDict
+from dataclasses import dataclass
 
+import numpy as np
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-from flwr_datasets import FederatedDataset
-from flwr_datasets.partitioner import DirichletPartitioner
-from torch.utils.data import DataLoader
-from torchvision.transforms import Compose, Normalize, ToTensor
+from torch.func import functional_call
+from torch.utils.data import Dataset
+
+from app_research_project.data_store import STORE_DIR, load_partition
+from app_research_project.partitioning import Partitioning
+from app_research_project.timing import span, timed
 
 
 class Net(nn.Module):
@@ -22,108 +28,307 @@ class Net(nn.Module):
         self.fc1 = nn.Linear(16 * 4 * 4, 120)
         self.fc2 = nn.Linear(120, 84)
         self.fc3 = nn.Linear(84, 10)
+        flatten_parameters(self)
 
     def forward(self, x):
         x = self.pool(F.relu(self.conv1(x)))
         x = self.pool(F.relu(self.conv2(x)))
-        x = x.view(-1, 16 * 4 * 4)
+        x = x.reshape(-1, 16 * 4 * 4)  # (a copy if `x` is channels-last)
         x = F.relu(self.fc1(x))
         x = F.relu(self.fc2(x))
         return self.fc3(x)
 
 
-def get_transforms():
-    """Return a function that apply standard transformations to images."""
+class PartitionDataset(Dataset):
+    """Pre-decoded images and labels, indexed as the dicts `train` and `test` expect."""
 
-    pytorch_transforms = Compose([ToTensor(), Normalize((0.5,), (0.5,))])
+    def __init__(self, images, labels):
+        self.images = images
+        self.labels = labels
 
-    def apply_transforms(batch):
-        """Apply transforms to the partition from FederatedDataset."""
-        batch["image"] = [pytorch_transforms(img) for img in batch["image"]]
-        return batch
+    def __len__(self):
+        return len(self.labels)
 
-    return apply_transforms
+    def __getitem__(self, idx):
+        return {"image": self.images[idx], "label": self.labels[idx]}
 
 
-fds = None  # Cache FederatedDataset
+class TensorLoader:
+    """Iterate over batches of a partition held as two contiguous tensors.
 
+    A drop-in replacement of `DataLoader` for small in-memory datasets: each batch is
+    sliced out of the `images` and `labels` tensors with one indexing operation instead
+    of collating `batch_size` samples one by one. Shuffling uses its own generator,
+    seeded with `seed` (an int or a tuple of ints), so the order of the batches is
+    reproducible.
+    """
 
-def load_data(partition_id: int, num_partitions: int):
-    """Load partition FashionMNIST data."""
-    # Only initialize `FederatedDataset` once
-    global fds
-    if fds is None:
-        partitioner = DirichletPartitioner(
-            num_partitions=num_partitions, partition_by="label", alpha=1.0
-        )
-        fds = FederatedDataset(
-            dataset="zalando-datasets/fashion_mnist",
-            partitioners={"train": partitioner},
-        )
-    partition = fds.load_partition(partition_id)
-    # Divide data on each node: 80% train, 20% test
-    partition_train_test = partition.train_test_split(test_size=0.2, seed=42)
+    def __init__(self, images, labels, batch_size=32, shuffle=False, seed=None):
+        self.dataset = PartitionDataset(images, labels)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.generator = torch.Generator()
+        self.reseed()
+
+    def reseed(self, *keys):
+        """Shuffle from the start of the sequence of `seed` mixed with `keys`.
+
+        e.g. `reseed(server_round)` gives each round its own order, the same whether the
+        loader is new or was kept from an earlier round.
+        """
+        if self.seed is not None:
+            seeds = self.seed if isinstance(self.seed, tuple) else (self.seed,)
+            state = np.random.SeedSequence([*seeds, *keys]).generate_state(1)[0]
+            self.generator.manual_seed(int(state))
+
+    def __len__(self):
+        return math.ceil(len(self.dataset) / self.batch_size)
 
-    partition_train_test = partition_train_test.with_transform(get_transforms())
-    trainloader = DataLoader(partition_train_test["train"], batch_size=32, shuffle=True)
-    testloader = DataLoader(partition_train_test["test"], batch_size=32)
+    def __iter__(self):
+        images, labels = self.dataset.images, self.dataset.labels
+        num_examples = len(labels)
+        if self.shuffle:
+            order = torch.randperm(num_examples, generator=self.generator)
+            for start in range(0, num_examples, self.batch_size):
+                idx = order[start : start + self.batch_size]
+                yield {"image": images[idx], "label": labels[idx]}
+        else:
+            for start in range(0, num_examples, self.batch_size):
+                end = start + self.batch_size
+                yield {"image": images[start:end], "label": labels[start:end]}
+
+
+def load_data(
+    partition_id: int,
+    num_partitions: int,
+    partitioning: Partitioning = Partitioning(),
+    store_dir=STORE_DIR,
+):
+    """Load partition FashionMNIST data.
+
+    The partition is gathered from the decoded dataset of the partition store, by the
+    index of `partitioning`. Its training batches are shuffled with a generator seeded
+    from the seed of the partitioning and `partition_id`, so every client draws its own
+    order (see `TensorLoader.reseed` for a new order each round).
+    """
+    partition = load_partition(partition_id, num_partitions, partitioning, store_dir)
+    trainloader = TensorLoader(
+        *partition["train"], batch_size=32, shuffle=True, seed=(partitioning.seed, partition_id)
+    )
+    testloader = TensorLoader(*partition["test"], batch_size=32)
     return trainloader, testloader
 
 
-def train(net, trainloader, epochs, lr, device):
+@dataclass(frozen=True)
+class TrainOptions:
+    """Opt-in fast paths of `train` and `test` on CPU.
+
+    - `bf16`: run the forward pass and the loss under bfloat16 autocast (parameters,
+      gradients and optimizer state stay float32).
+    - `channels_last`: feed the images in channels-last memory format, which the
+      convolutions of `Net` then run in. The weights keep their flat buffer.
+    - `compile`: run the model through `torch.compile`, compiled once per process
+      (see `compiled_forward`) and reused by every client and round.
+    - `fused`: update the parameters with the fused (single kernel) Adam.
+    """
+
+    bf16: bool = False
+    channels_last: bool = False
+    compile: bool = False
+    fused: bool = False
+
+    @classmethod
+    def from_run_config(cls, run_config) -> "TrainOptions":
+        return cls(
+            bf16=run_config["bf16-autocast"],
+            channels_last=run_config["channels-last"],
+            compile=run_config["torch-compile"],
+            fused=run_config["fused-optimizer"],
+        )
+
+    def optimizer(self, net, lr):
+        """A new Adam optimizer of `net`."""
+        return torch.optim.Adam(net.parameters(), lr=lr, fused=self.fused or None)
+
+    def model(self, net):
+        """The function to run `net` with."""
+        return compiled_forward(net) if self.compile else net
+
+    def images(self, images, device):
+        """Move a batch of images to `device`, in the memory format to run it in."""
+        images = images.to(device)
+        if self.channels_last:
+            images = images.contiguous(memory_format=torch.channels_last)
+        return images
+
+    def autocast(self, device):
+        """Autocast context of the forward pass (a no-op without `bf16`)."""
+        return torch.autocast(torch.device(device).type, dtype=torch.bfloat16, enabled=self.bf16)
+
+
+_compiled_forwards = {}  # Compiled forward of each model class, shared by its instances
+
+
+def compiled_forward(net):
+    """Return a function running `net` through a `torch.compile`d forward.
+
+    Compiling `net` itself would compile again for every new instance (every client
+    of a process). Instead the forward of a template instance is compiled once per
+    model class and called with the parameters of `net`.
+    """
+    model_cls = type(net)
+    if model_cls not in _compiled_forwards:
+        template = model_cls()
+        _compiled_forwards[model_cls] = torch.compile(
+            lambda tensors, x: functional_call(template, tensors, (x,))
+        )
+    forward = _compiled_forwards[model_cls]
+    tensors = {**dict(net.named_parameters()), **dict(net.named_buffers())}
+    return lambda x: forward(tensors, x)
+
+
+def train(net, trainloader, epochs, lr, device, optimizer=None, options=TrainOptions()):
     """Train the model on the training set.
 
     This is a fairly standard training loop for PyTorch. Note there is nothing specific
     about Flower or Federated AI here.
+
+    `optimizer` continues from the state of an optimizer of `net` (e.g. one kept from
+    a previous round) with learning rate `lr`; by default a new Adam is created.
+    `options` enables the fast paths of `TrainOptions`. The loss is summed on the
+    device and read once at the end, so the steps don't wait for each other.
+
+    Recorded as a `train` span, split into the time spent waiting for batches
+    (`data_load`) and the rest (`forward_backward`).
     """
-    net.to(device)  # move model to GPU if available
-    criterion = torch.nn.CrossEntropyLoss().to(device)
-    optimizer = torch.optim.Adam(net.parameters(), lr=lr)
-    net.train()
-    running_loss = 0.0
-    for _ in range(epochs):
-        for batch in trainloader:
-            images = batch["image"]
-            labels = batch["label"]
-            optimizer.zero_grad()
-            loss = criterion(net(images.to(device)), labels.to(device))
-            loss.backward()
-            optimizer.step()
-            running_loss += loss.item()
-
-    avg_trainloss = running_loss / len(trainloader)
+    with span("train", epochs=epochs) as phases:
+        begin = time.perf_counter()
+        net.to(device)  # move model to GPU if available
+        criterion = torch.nn.CrossEntropyLoss().to(device)
+        if optimizer is None:
+            optimizer = options.optimizer(net, lr)
+        for group in optimizer.param_groups:
+            group["lr"] = lr
+        net.train()
+        model = options.model(net)
+        running_loss = torch.zeros((), dtype=torch.float64, device=device)
+        for _ in range(epochs):
+            for batch in timed(trainloader, phases, "data_load"):
+                images = options.images(batch["image"], device)
+                labels = batch["label"]
+                optimizer.zero_grad(set_to_none=True)
+                with options.autocast(device):
+                    loss = criterion(model(images), labels.to(device))
+                loss.backward()
+                optimizer.step()
+                running_loss += loss.detach()
+
+        # An empty partition trains nothing (and reports a loss of 0)
+        avg_trainloss = running_loss.item() / max(len(trainloader), 1)
+        phases["forward_backward"] = time.perf_counter() - begin - phases.get("data_load", 0.0)
     return avg_trainloss
 
 
-def test(net, testloader, device):
+def test(net, testloader, device, options=TrainOptions()):
     """Validate the model on the test set.
 
     This is a fairly standard training loop for PyTorch. Note there is nothing specific
     about Flower or Federated AI here.
+
+    Recorded as a `test` span, split into `data_load` and `forward` like `train`. The
+    loss and the correct predictions are summed on the device and read once.
+    """
+    with span("test") as phases:
+        begin = time.perf_counter()
+        net.to(device)
+        criterion = torch.nn.CrossEntropyLoss()
+        model = options.model(net)
+        correct = torch.zeros((), dtype=torch.int64, device=device)
+        loss = torch.zeros((), dtype=torch.float64, device=device)
+        with torch.no_grad():
+            for batch in timed(testloader, phases, "data_load"):
+                images = options.images(batch["image"], device)
+                labels = batch["label"].to(device)
+                with options.autocast(device):
+                    outputs = model(images)
+                    loss += criterion(outputs, labels)
+                correct += (outputs.argmax(1) == labels).sum()
+        accuracy = correct.item() / max(len(testloader.dataset), 1)
+        loss = loss.item() / max(len(testloader), 1)
+        phases["forward"] = time.perf_counter() - begin - phases.get("data_load", 0.0)
+    return loss, accuracy
+
+
+def test_shards(net, images, labels, sizes, device, batch_size=10_000):
+    """Validate the model on several test sets concatenated into one.
+
+    `images` and `labels` hold the test sets one after the other, `sizes` their lengths.
+    The model runs over all of them in large batches and the per-example losses and
+    predictions are split back into one `(loss, accuracy)` pair per test set.
     """
     net.to(device)
-    criterion = torch.nn.CrossEntropyLoss()
-    correct, loss = 0, 0.0
+    criterion = torch.nn.CrossEntropyLoss(reduction="none")
+    losses, corrects = [], []
     with torch.no_grad():
-        for batch in testloader:
-            images = batch["image"].to(device)
-            labels = batch["label"].to(device)
-            outputs = net(images)
-            loss += criterion(outputs, labels).item()
-            correct += (torch.max(outputs.data, 1)[1] == labels).sum().item()
-    accuracy = correct / len(testloader.dataset)
-    loss = loss / len(testloader)
-    return loss, accuracy
+        for start in range(0, len(labels), batch_size):
+            batch_images = images[start : start + batch_size].to(device)
+            batch_labels = labels[start : start + batch_size].to(device)
+            outputs = net(batch_images)
+            losses.append(criterion(outputs, batch_labels))
+            corrects.append(outputs.argmax(1) == batch_labels)
+    losses = torch.cat(losses).split(sizes)
+    corrects = torch.cat(corrects).split(sizes)
+    return [(loss.mean().item(), correct.float().mean().item()) for loss, correct in zip(losses, corrects)]
 
 
-def get_weights(net):
+def flatten_parameters(net):
+    """Move all the tensors of the state_dict of a model into one contiguous buffer.
+
+    Each parameter becomes a view into `net.flat_parameters`, so the weights of the
+    model are exported and imported as a whole (see `get_weights` and `set_weights`).
+    """
+    tensors = list(net.state_dict(keep_vars=True).values())
+    flat = torch.cat([t.detach().reshape(-1) for t in tensors])
+    layout, offset = [], 0
+    for t in tensors:
+        t.data = flat[offset : offset + t.numel()].view_as(t)
+        layout.append((offset, offset + t.numel(), t.shape))
+        offset += t.numel()
+    net.flat_parameters = flat
+    net.flat_tensors = tensors
+    net.flat_layout = layout
+    return flat
+
+
+def _flat_parameters(net):
+    """Return the flat buffer of a model, rebuilding it if the tensors left it.
+
+    This happens when e.g. `net.to(device)` moves the parameters to another device.
+    """
+    flat = getattr(net, "flat_parameters", None)
+    if flat is not None:
+        storage = flat.untyped_storage().data_ptr()
+        if all(t.untyped_storage().data_ptr() == storage for t in net.flat_tensors):
+            return flat
+    return flatten_parameters(net)
+
+
+def get_weights(net, copy=True):
     """Extract parameters from a model.
 
     Note this is specific to PyTorch. You might want to update this function if you use
     a more exotic model architecture or if you don't want to extrac all elements in
     state_dict.
+
+    The arrays are views into one copy of the flat buffer of the model, made with a
+    single memcpy. With `copy=False` (on the CPU) they are views into the buffer itself,
+    which change when the model is trained again: only use it when the arrays are
+    consumed before that, e.g. serialized right away.
     """
-    return [val.cpu().numpy() for _, val in net.state_dict().items()]
+    flat = _flat_parameters(net).detach().cpu()
+    flat = flat.numpy().copy() if copy else flat.numpy()
+    return [flat[start:end].reshape(shape) for start, end, shape in net.flat_layout]
 
 
 def set_weights(net, parameters):
@@ -132,7 +337,20 @@ def set_weights(net, parameters):
     Note this is specific to PyTorch. You might want to update this function if you use
     a more exotic model architecture or if you don't want to replace the entire
     state_dict.
+
+    Every array is copied straight into its slice of the flat buffer of the model.
     """
-    params_dict = zip(net.state_dict().keys(), parameters)
-    state_dict = OrderedDict({k: torch.from_numpy(v) for k, v in params_dict})
-    net.load_state_dict(state_dict, strict=True)
\ No newline at end of file
+    flat = _flat_parameters(net)
+    if len(parameters) != len(net.flat_layout):
+        raise ValueError(f"Expected {len(net.flat_layout)} arrays, got {len(parameters)}")
+    with torch.no_grad():
+        for (start, end, shape), array in zip(net.flat_layout, parameters):
+            value = torch.as_tensor(array)
+            if value.shape != shape:
+                raise ValueError(f"Expected an array of shape {tuple(shape)}, got {tuple(value.shape)}")
+            flat[start:end].copy_(value.reshape(-1))
+
+
+def state_dict_from_weights(net_keys, parameters):
+    """Build a state_dict from the arrays returned by `get_weights`, without a model."""
+    return OrderedDict((key, torch.from_numpy(array)) for key, array in zip(net_keys, parameters))
\ No newline at end of file
@@ -0,0 +1,135 @@
+"""my-awesome-app: Time the phases of the rounds and export them as a Chrome trace."""
+
+import contextvars
+import json
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+from app_research_project.metrics_log import SERVER_LOG, client_log_name, read_records
+
+TRACE_FILE = "trace.json"
+
+# Tracer `span` records to in the current thread (none outside of instrumented code)
+_active = contextvars.ContextVar("active_tracer", default=None)
+
+
+class Tracer:
+    """Record timed spans as `span` records of a `MetricsLogger`.
+
+    A span has a name, a start time, a duration and the `context` of the tracer (e.g.
+    the round and the partition) along with its own arguments. `process` names the
+    process of the trace the spans belong to (the server or a client).
+    """
+
+    def __init__(self, metrics_log, process: str, **context):
+        self.metrics_log = metrics_log
+        self.process = process
+        self.context = context
+
+    def record(self, name: str, start: float, duration: float, **args) -> None:
+        """Record a span that started at `start` (seconds since the epoch)."""
+        self.metrics_log.log(
+            event="span",
+            name=name,
+            process=self.process,
+            thread=threading.get_native_id(),
+            start=start,
+            duration=duration,
+            **self.context,
+            **args,
+        )
+
+    @contextmanager
+    def span(self, name: str, **args):
+        """Time the enclosed block. It can add arguments to the dict it receives."""
+        start = time.time()
+        begin = time.perf_counter()
+        try:
+            yield args
+        finally:
+            self.record(name, start, time.perf_counter() - begin, **args)
+
+    @contextmanager
+    def activate(self, **context):
+        """Make `span` record to this tracer (with extra `context`) in the enclosed block."""
+        tracer = Tracer(self.metrics_log, self.process, **self.context, **context)
+        token = _active.set(tracer)
+        try:
+            yield tracer
+        finally:
+            _active.reset(token)
+
+
+def activate(tracer: Tracer | None, **context):
+    """`tracer.activate(**context)`, or a no-op when timing is disabled (no tracer)."""
+    if tracer is None:
+        return nullcontext()
+    return tracer.activate(**context)
+
+
+@contextmanager
+def span(name: str, **args):
+    """Time the enclosed block as a span of the active tracer (if any).
+
+    Like `Tracer.span`, the block receives a dict it can add arguments to, e.g. the
+    time spent in one of its phases. Without an active tracer nothing is recorded.
+    """
+    tracer = _active.get()
+    if tracer is None:
+        yield args
+        return
+    with tracer.span(name, **args) as span_args:
+        yield span_args
+
+
+def timed(iterable, phases: dict, key: str):
+    """Iterate over `iterable`, adding the time spent waiting for each item to `phases[key]`."""
+    iterator = iter(iterable)
+    phases.setdefault(key, 0.0)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            phases[key] += time.perf_counter() - start
+        yield item
+
+
+def write_chrome_trace(run_dir) -> Path:
+    """Gather the spans of the ServerApp and the ClientApps of a run into a trace file.
+
+    The file follows the Chrome trace-event format: open it in `chrome://tracing` or
+    https://ui.perfetto.dev to see where the time of each round goes.
+    """
+    run_dir = Path(run_dir)
+    paths = [run_dir / SERVER_LOG] + sorted(run_dir.glob(client_log_name("*")))
+    events, pids = [], {}
+    for path in paths:
+        for record in read_records(path):
+            if record.get("event") != "span":
+                continue
+            process = record.pop("process")
+            if process not in pids:
+                pids[process] = len(pids)
+                events.append(
+                    {"name": "process_name", "ph": "M", "pid": pids[process], "args": {"name": process}}
+                )
+            events.append(
+                {
+                    "name": record.pop("name"),
+                    "ph": "X",
+                    "ts": record.pop("start") * 1e6,
+                    "dur": record.pop("duration") * 1e6,
+                    "pid": pids[process],
+                    "tid": record.pop("thread"),
+                    "args": {k: v for k, v in record.items() if k != "event"},
+                }
+            )
+    path = run_dir / TRACE_FILE
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    return path
@@ -0,0 +1,171 @@
+"""my-awesome-app: Run the benchmark suite and compare its results.
+
+Run from the root of the project with
+
+    python -m benchmarks run --output results.json [--only training weights] [--quick]
+    python -m benchmarks compare baseline.json results.json [--threshold 0.1]
+
+`run` writes the results of the benchmarks along with the environment they ran in.
+`compare` prints the change of every timing and throughput between two result files
+and exits with status 1 if any got worse by more than `threshold` (relative).
+"""
+
+import argparse
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+from importlib.metadata import version
+
+# Benchmark module and the arguments of its `run` (full, --quick)
+SUITE = {
+    "training": ("bench_training", {}, {"num_examples": 2000, "repeats": 1}),
+    "weights": ("bench_weights", {}, {"number": 200}),
+    "data": ("bench_data", {}, {"repeats": 2}),
+    "client_cache": ("bench_client_cache", {}, {"num_rounds": 3}),
+    "fast_path": ("bench_fast_path", {}, {"epochs": 2, "variants": ("fp32", "bf16", "channels_last")}),
+    "aggregation": ("bench_aggregation", {"num_clients": (10, 100, 1000)}, {"num_clients": (10, 100)}),
+    "rounds": ("bench_rounds", {}, {"num_supernodes": (2, 10), "num_rounds": 2}),
+}
+
+# Metrics are recognised by the suffix of their name; anything else isn't compared
+HIGHER_IS_BETTER = ("per_s", "speedup", "accuracy")
+LOWER_IS_BETTER = ("_s", "_us", "_ms", "seconds", "_mb")
+
+
+def environment() -> dict:
+    """What the results depend on besides the code: versions, machine and commit."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(
+            subprocess.run(
+                ["git", "status", "--porcelain", "--untracked-files=no"],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        commit, dirty = None, None
+    import torch
+
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "torch_threads": torch.get_num_threads(),
+        "packages": {name: version(name) for name in ("torch", "flwr", "numpy", "flwr-datasets")},
+        "git_commit": commit,
+        "git_dirty": dirty,
+    }
+
+
+def run_suite(names, quick=False) -> dict:
+    """Run the benchmarks in `names`; one that fails records its error instead."""
+    benchmarks = {}
+    for name in names:
+        module, full, reduced = SUITE[name]
+        print(f"Running {name}...", file=sys.stderr)
+        try:
+            run = importlib.import_module(f"benchmarks.{module}").run
+            benchmarks[name] = run(**(reduced if quick else full))
+        except Exception as e:  # keep the results of the other benchmarks
+            benchmarks[name] = {"benchmark": name, "error": repr(e)}
+    return {"env": environment(), "quick": quick, "benchmarks": benchmarks}
+
+
+def flatten(value, prefix=""):
+    """`{"a": {"b": 1}}` -> `{"a.b": 1}` for the numeric leaves of `value`."""
+    if isinstance(value, dict):
+        flat = {}
+        for key, item in value.items():
+            flat.update(flatten(item, f"{prefix}.{key}" if prefix else str(key)))
+        return flat
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {prefix: value}
+    return {}
+
+
+def direction(metric: str) -> int:
+    """1 if higher values of `metric` are better, -1 if lower ones are, 0 to skip it."""
+    name = metric.rsplit(".", 1)[-1]
+    if name.endswith(HIGHER_IS_BETTER):
+        return 1
+    if name.endswith(LOWER_IS_BETTER):
+        return -1
+    return 0
+
+
+def compare(baseline: dict, current: dict, threshold: float = 0.1) -> list[dict]:
+    """One row per metric found in both files, flagging the regressions beyond `threshold`."""
+    rows = []
+    for name, result in current["benchmarks"].items():
+        before = baseline["benchmarks"].get(name, {})
+        if before.get("params") != result.get("params"):
+            print(f"{name}: parameters differ, skipped", file=sys.stderr)
+            continue
+        old, new = flatten(before.get("results", {})), flatten(result.get("results", {}))
+        for metric in sorted(old.keys() & new.keys()):
+            sign = direction(metric)
+            if not sign or not old[metric]:
+                continue
+            change = (new[metric] - old[metric]) / abs(old[metric])
+            rows.append(
+                {
+                    "metric": f"{name}.{metric}",
+                    "baseline": old[metric],
+                    "current": new[metric],
+                    "change": change,
+                    "regression": sign * change < -threshold,
+                }
+            )
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("--output", default=None, help="file to write the results to (default: stdout)")
+    run_parser.add_argument("--only", nargs="+", choices=list(SUITE), default=list(SUITE))
+    run_parser.add_argument("--quick", action="store_true", help="smaller sizes, for a quick check")
+    compare_parser = commands.add_parser("compare", help="flag regressions between two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args()
+
+    if args.command == "run":
+        results = json.dumps(run_suite(args.only, args.quick), indent=2)
+        if args.output is None:
+            print(results)
+        else:
+            with open(args.output, "w", encoding="utf-8") as f:
+                f.write(results)
+        return
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+    for key in ("cpu_count", "torch_threads", "packages"):
+        if baseline["env"].get(key) != current["env"].get(key):
+            print(f"warning: {key} differs between the result files", file=sys.stderr)
+    rows = compare(baseline, current, args.threshold)
+    for row in rows:
+        flag = "REGRESSION" if row["regression"] else ""
+        print(f"{row['metric']:<60} {row['baseline']:>12.4g} {row['current']:>12.4g} {row['change']:>+8.1%} {flag}")
+    regressions = sum(row["regression"] for row in rows)
+    print(f"{regressions} regression(s) out of {len(rows)} metrics (threshold {args.threshold:.0%})")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""my-awesome-app: Server memory of aggregating a round with FedAvg vs streaming.
+
+Run from the root of the project with `python -m benchmarks.bench_aggregation`. The
+updates of a round arrive one at a time: FedAvg keeps them until `aggregate_fit`, as
+Flower's `Server` does, while streaming folds each of them in on arrival, as the
+`DeadlineServer` does.
+"""
+
+import argparse
+import json
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from flwr.common import Code, FitRes, Status, ndarrays_to_parameters, parameters_to_ndarrays
+from flwr.server.client_proxy import ClientProxy
+from flwr.server.strategy import FedAvg
+
+from app_research_project.batched_train import PartitionProxy
+from app_research_project.my_strategy import CustomFedAvg
+from app_research_project.task import Net, get_weights
+
+
+def receive_update(weights, client: int, seed: int = 0) -> tuple[ClientProxy, FitRes]:
+    """The serialized update of `client`, around `weights`, as the server receives it."""
+    rng = np.random.default_rng([seed, client])
+    client_weights = [w + rng.normal(0, 0.01, w.shape).astype(w.dtype) for w in weights]
+    parameters = ndarrays_to_parameters(client_weights)
+    fit_res = FitRes(Status(code=Code.OK, message=""), parameters, int(rng.integers(50, 500)), {})
+    return PartitionProxy(client), fit_res
+
+
+def measure(strategy, weights, num_clients) -> tuple[list, dict]:
+    """Receive and aggregate one round; return the result, its time and peak memory."""
+    streaming = isinstance(strategy, CustomFedAvg)
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    results = []
+    for client in range(num_clients):
+        results.append(receive_update(weights, client))
+        if streaming:
+            strategy.fold_update(1, results[-1][1])
+    parameters, _ = strategy.aggregate_fit(1, results, [])
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+    return parameters_to_ndarrays(parameters), {"seconds": seconds, "peak_mb": peak / 2**20}
+
+
+def run(num_clients=(100, 1000)) -> dict:
+    """Peak memory and time of receiving and aggregating the updates of a round."""
+    run_dir = tempfile.mkdtemp()
+    strategies = {
+        "fedavg": FedAvg(inplace=False),
+        "fedavg_inplace": FedAvg(),
+        "streaming": CustomFedAvg(run_dir=run_dir),
+    }
+    weights = get_weights(Net())
+    results = {}
+    for n in num_clients:
+        outputs, results[n] = {}, {}
+        for name, strategy in strategies.items():
+            outputs[name], results[n][name] = measure(strategy, weights, n)
+        results[n]["max_abs_diff"] = max(
+            float(np.abs(a - b).max()) for a, b in zip(outputs["streaming"], outputs["fedavg"])
+        )
+        results[n]["model_mb"] = sum(w.nbytes for w in weights) / 2**20
+    strategies["streaming"].close()
+    return {
+        "benchmark": "aggregation",
+        "params": {"num_clients": list(num_clients)},
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num-clients", type=int, nargs="+", default=[100, 1000])
+    args = parser.parse_args()
+    print(json.dumps(run(args.num_clients), indent=2))
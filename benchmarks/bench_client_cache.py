@@ -0,0 +1,93 @@
+"""my-awesome-app: Time-to-first-batch of the ClientApps with and without the client cache.
+
+Run from the root of the project with `python -m benchmarks.bench_client_cache`. The
+rounds are simulated in this process, like the ClientApps one simulation process runs:
+each round samples `num_clients` of the partitions, builds their ClientApp with
+`client_fn` and draws the first training batch. The partitions are in the partition
+store beforehand, so the uncached time is that of a warm `load_data`.
+"""
+
+import argparse
+import json
+import random
+import tempfile
+import time
+
+from flwr.common import Context, RecordDict
+from flwr.common.config import get_project_config
+
+from app_research_project.client_app import client_fn
+from app_research_project.client_cache import CLIENT_CACHE
+from app_research_project.partitioning import Partitioning
+from app_research_project.sweep import PROJECT_DIR
+from app_research_project.task import load_data
+
+
+def time_to_first_batch(run_config, num_partitions, num_clients, num_rounds, seed) -> list[float]:
+    """Mean seconds from `client_fn` to the first training batch, per round."""
+    rng = random.Random(seed)
+    CLIENT_CACHE.clear()
+    per_round = []
+    for _ in range(num_rounds):
+        times = []
+        for partition_id in rng.sample(range(num_partitions), num_clients):
+            context = Context(
+                run_id=1,
+                node_id=partition_id,
+                node_config={"partition-id": partition_id, "num-partitions": num_partitions},
+                state=RecordDict(),
+                run_config=run_config,
+            )
+            start = time.perf_counter()
+            client = client_fn(context)
+            next(iter(client.numpy_client.trainloader))
+            times.append(time.perf_counter() - start)
+        per_round.append(sum(times) / len(times))
+    CLIENT_CACHE.clear()
+    return per_round
+
+
+def run(num_partitions=10, num_clients=5, num_rounds=5, cache_size=16, seed=0) -> dict:
+    """Time-to-first-batch of every round with the cache disabled and enabled."""
+    run_config = {
+        **get_project_config(PROJECT_DIR)["tool"]["flwr"]["app"]["config"],
+        "run-dir": tempfile.mkdtemp(),
+    }
+    for partition_id in range(num_partitions):
+        load_data(partition_id, num_partitions, Partitioning.from_run_config(run_config))
+    results = {}
+    for name, size in (("uncached", 0), ("cached", cache_size)):
+        per_round = time_to_first_batch(
+            {**run_config, "client-cache-size": size}, num_partitions, num_clients, num_rounds, seed
+        )
+        results[name] = {
+            "first_round_s": per_round[0],
+            "later_rounds_s": sum(per_round[1:]) / len(per_round[1:]) if num_rounds > 1 else None,
+        }
+    return {
+        "benchmark": "client_cache",
+        "params": {
+            "num_partitions": num_partitions,
+            "num_clients": num_clients,
+            "num_rounds": num_rounds,
+            "cache_size": cache_size,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num-partitions", type=int, default=10)
+    parser.add_argument("--num-clients", type=int, default=5)
+    parser.add_argument("--num-rounds", type=int, default=5)
+    parser.add_argument("--cache-size", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(
+        json.dumps(
+            run(args.num_partitions, args.num_clients, args.num_rounds, args.cache_size, args.seed),
+            indent=2,
+        )
+    )
@@ -0,0 +1,44 @@
+"""my-awesome-app: Latency of loading the data of a client, cold and warm.
+
+Run from the root of the project with `python -m benchmarks.bench_data`. The cold load
+decodes the dataset and computes the partition index into an empty partition store
+(the dataset itself must already be in the cache of Hugging Face Datasets), the warm
+loads gather the partition from the memory-mapped store.
+"""
+
+import argparse
+import json
+import tempfile
+import time
+
+from app_research_project.task import load_data
+from benchmarks.bench_loader import best_of
+
+
+def run(num_partitions: int = 10, partition_id: int = 0, repeats: int = 5) -> dict:
+    """Time `load_data` into an empty store, then from the store, and its first batch."""
+    store_dir = tempfile.mkdtemp()
+
+    start = time.perf_counter()
+    trainloader, _ = load_data(partition_id, num_partitions, store_dir=store_dir)
+    next(iter(trainloader))
+    cold = time.perf_counter() - start
+
+    def warm_load():
+        trainloader, _ = load_data(partition_id, num_partitions, store_dir=store_dir)
+        next(iter(trainloader))
+
+    return {
+        "benchmark": "data",
+        "params": {"num_partitions": num_partitions, "partition_id": partition_id, "repeats": repeats},
+        "results": {"load_data_cold_s": cold, "load_data_warm_s": best_of(warm_load, repeats)},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num-partitions", type=int, default=10)
+    parser.add_argument("--partition-id", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+    print(json.dumps(run(args.num_partitions, args.partition_id, args.repeats), indent=2))
@@ -0,0 +1,80 @@
+"""my-awesome-app: Speed and accuracy of the fast paths of `train` (`TrainOptions`).
+
+Run from the root of the project with `python -m benchmarks.bench_fast_path`. Every
+variant trains the same initial model on the same batches of a partition, and is
+evaluated on its validation split. The first epoch, which includes compiling with
+`torch-compile`, is reported apart from the throughput of the others.
+"""
+
+import argparse
+import json
+import time
+
+import torch
+
+from app_research_project.task import Net, TrainOptions, load_data, test, train
+
+VARIANTS = {
+    "fp32": TrainOptions(),
+    "bf16": TrainOptions(bf16=True),
+    "channels_last": TrainOptions(channels_last=True),
+    "compile": TrainOptions(compile=True),
+    "fused": TrainOptions(fused=True),
+    "all": TrainOptions(bf16=True, channels_last=True, compile=True, fused=True),
+}
+
+
+def run(num_partitions=10, partition_id=0, epochs=3, variants=tuple(VARIANTS), seed=0) -> dict:
+    """Train each variant for `epochs` epochs; compare it with `fp32`."""
+    trainloader, valloader = load_data(partition_id, num_partitions)
+    num_examples = len(trainloader.dataset)
+    results = {}
+    for name in variants:
+        options = VARIANTS[name]
+        torch.manual_seed(seed)
+        net = Net()
+        trainloader.reseed()
+        epoch_times = []
+        for _ in range(epochs):
+            start = time.perf_counter()
+            train(net, trainloader, 1, 0.01, "cpu", options=options)
+            epoch_times.append(time.perf_counter() - start)
+        loss, accuracy = test(net, valloader, "cpu", options)
+        steady = epoch_times[1:] or epoch_times
+        results[name] = {
+            "first_epoch_s": epoch_times[0],
+            "train_samples_per_s": num_examples * len(steady) / sum(steady),
+            "loss": loss,
+            "accuracy": accuracy,
+        }
+    if "fp32" in results:
+        for result in results.values():
+            result["speedup"] = result["train_samples_per_s"] / results["fp32"]["train_samples_per_s"]
+            result["accuracy_delta"] = result["accuracy"] - results["fp32"]["accuracy"]
+    return {
+        "benchmark": "fast_path",
+        "params": {
+            "num_partitions": num_partitions,
+            "partition_id": partition_id,
+            "epochs": epochs,
+            "variants": list(variants),
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num-partitions", type=int, default=10)
+    parser.add_argument("--partition-id", type=int, default=0)
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--variants", nargs="+", choices=list(VARIANTS), default=list(VARIANTS))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(
+        json.dumps(
+            run(args.num_partitions, args.partition_id, args.epochs, args.variants, args.seed),
+            indent=2,
+        )
+    )
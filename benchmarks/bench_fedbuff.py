@@ -0,0 +1,96 @@
+"""my-awesome-app: Time-to-accuracy of synchronous FedAvg vs FedBuff with a straggler.
+
+Run from the root of the project with `python -m benchmarks.bench_fedbuff`. Both
+simulations run with the same `simulated-latency`, by default a single partition
+replying 10 seconds late.
+"""
+
+import argparse
+import json
+import tempfile
+
+from app_research_project.sweep import CellResult, SweepCell, load_federation, run_sweep
+
+
+def time_to_accuracy(result: CellResult, target: float) -> float | None:
+    """Seconds from the initial evaluation until the global model reached `target`."""
+    start = result.rounds[0]["time"]
+    for _, metrics in sorted(result.rounds.items()):
+        if metrics.get("cen_accuracy", 0.0) >= target:
+            return metrics["time"] - start
+    return None
+
+
+def run(
+    federation="local-simulation",
+    latency="0:10",
+    num_rounds=5,
+    fedbuff_rounds=10,
+    buffer_size=2,
+    target=0.7,
+) -> dict:
+    """Run both aggregations and report their time-to-accuracy and final accuracy."""
+    num_supernodes = load_federation(federation)["num-supernodes"]
+    base = {"simulated-latency": latency}
+    cells = {
+        "sync": SweepCell({**base, "num-server-rounds": num_rounds}, num_supernodes, federation),
+        "fedbuff": SweepCell(
+            {
+                **base,
+                "num-server-rounds": fedbuff_rounds,
+                "aggregation": "fedbuff",
+                "buffer-size": buffer_size,
+            },
+            num_supernodes,
+            federation,
+        ),
+    }
+    results = {}
+    outputs = run_sweep(list(cells.values()), output_dir=tempfile.mkdtemp())
+    for name, result in zip(cells, outputs):
+        if result.status != "ok":
+            results[name] = {"status": result.status, "error": result.error}
+            continue
+        results[name] = {
+            "status": result.status,
+            "time_to_accuracy_s": time_to_accuracy(result, target),
+            "wall_time_s": result.rounds[max(result.rounds)]["time"] - result.rounds[0]["time"],
+            "final_accuracy": result.final_accuracy,
+            "rounds": max(result.rounds),
+        }
+    return {
+        "benchmark": "fedbuff",
+        "params": {
+            "federation": federation,
+            "latency": latency,
+            "num_rounds": num_rounds,
+            "fedbuff_rounds": fedbuff_rounds,
+            "buffer_size": buffer_size,
+            "target": target,
+        },
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--federation", default="local-simulation")
+    parser.add_argument("--latency", default="0:10")
+    parser.add_argument("--num-rounds", type=int, default=5)
+    parser.add_argument("--fedbuff-rounds", type=int, default=10)
+    parser.add_argument("--buffer-size", type=int, default=2)
+    parser.add_argument("--target", type=float, default=0.7)
+    args = parser.parse_args()
+    print(
+        json.dumps(
+            run(
+                args.federation,
+                args.latency,
+                args.num_rounds,
+                args.fedbuff_rounds,
+                args.buffer_size,
+                args.target,
+            ),
+            indent=2,
+        )
+    )
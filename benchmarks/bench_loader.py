@@ -0,0 +1,65 @@
+"""my-awesome-app: Per-epoch time of `TensorLoader` against a `DataLoader`.
+
+Run from the root of the project with `python -m benchmarks.bench_loader`.
+"""
+
+import argparse
+import json
+import time
+
+import torch
+from torch.utils.data import DataLoader
+
+from app_research_project.task import Net, PartitionDataset, TensorLoader, train
+
+
+def make_partition(num_examples: int, seed: int = 0):
+    """Random pre-decoded images and labels with the shape of a FashionMNIST partition."""
+    generator = torch.Generator().manual_seed(seed)
+    images = torch.randn(num_examples, 1, 28, 28, generator=generator)
+    labels = torch.randint(0, 10, (num_examples,), generator=generator)
+    return images, labels
+
+
+def best_of(fn, repeats: int) -> float:
+    """Smallest wall time of `repeats` calls to `fn`."""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def run(num_examples: int = 6000, batch_size: int = 32, repeats: int = 3) -> dict:
+    """Time one epoch of iteration, and of training, with each loader."""
+    images, labels = make_partition(num_examples)
+    loaders = {
+        "dataloader": DataLoader(PartitionDataset(images, labels), batch_size=batch_size, shuffle=True),
+        "tensor_loader": TensorLoader(images, labels, batch_size=batch_size, shuffle=True, seed=0),
+    }
+    results = {}
+    for name, loader in loaders.items():
+        net = Net()
+        results[name] = {
+            "iterate_epoch_s": best_of(lambda: sum(1 for _ in loader), repeats),
+            "train_epoch_s": best_of(lambda: train(net, loader, 1, 0.01, "cpu"), repeats),
+        }
+    results["speedup"] = {
+        metric: results["dataloader"][metric] / results["tensor_loader"][metric]
+        for metric in ("iterate_epoch_s", "train_epoch_s")
+    }
+    return {
+        "benchmark": "loader",
+        "params": {"num_examples": num_examples, "batch_size": batch_size, "repeats": repeats},
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num-examples", type=int, default=6000)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    print(json.dumps(run(args.num_examples, args.batch_size, args.repeats), indent=2))
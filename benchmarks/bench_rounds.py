@@ -0,0 +1,48 @@
+"""my-awesome-app: End-to-end time of a round against the number of SuperNodes.
+
+Run from the root of the project with `python -m benchmarks.bench_rounds`. Each size
+is a simulation of the federation with its `num-supernodes` overridden.
+"""
+
+import argparse
+import json
+import tempfile
+
+from app_research_project.sweep import SweepCell, run_sweep
+
+
+def run(federation="local-simulation", num_supernodes=(2, 10, 100), num_rounds=3) -> dict:
+    """Wall time of the first round (which includes starting the backend) and of the others."""
+    cells = [
+        SweepCell({"num-server-rounds": num_rounds}, n, federation, tags={"num_supernodes": n})
+        for n in num_supernodes
+    ]
+    results = {}
+    for n, result in zip(num_supernodes, run_sweep(cells, output_dir=tempfile.mkdtemp())):
+        if result.status != "ok":
+            results[n] = {"status": result.status, "error": result.error}
+            continue
+        times = [row["round_time"] for row in result.round_rows() if row["round_time"] is not None]
+        results[n] = {
+            "status": result.status,
+            "first_round_s": times[0],
+            "round_s": sum(times[1:]) / len(times[1:]) if len(times) > 1 else None,
+        }
+    return {
+        "benchmark": "rounds",
+        "params": {
+            "federation": federation,
+            "num_supernodes": list(num_supernodes),
+            "num_rounds": num_rounds,
+        },
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--federation", default="local-simulation")
+    parser.add_argument("--num-supernodes", type=int, nargs="+", default=[2, 10, 100])
+    parser.add_argument("--num-rounds", type=int, default=3)
+    args = parser.parse_args()
+    print(json.dumps(run(args.federation, args.num_supernodes, args.num_rounds), indent=2))
@@ -0,0 +1,58 @@
+"""my-awesome-app: Local training of K clients, one after the other vs stacked with `vmap`.
+
+Run from the root of the project with `python -m benchmarks.bench_stacked_train`.
+"""
+
+import argparse
+import json
+import time
+
+from app_research_project.batched_train import train_stacked
+from app_research_project.task import Net, TensorLoader, get_weights, set_weights, train
+from benchmarks.bench_loader import make_partition
+
+
+def run(num_clients: int = 100, num_examples: int = 480, epochs: int = 1) -> dict:
+    """Time one round of local training of `num_clients` clients with both backends.
+
+    The default sizes match a partition of the `gpu-sim` federation (100 SuperNodes,
+    80% of 60k training images split among them).
+    """
+    partitions = [make_partition(num_examples, seed=i) for i in range(num_clients)]
+    parameters = get_weights(Net())
+
+    def loaders():
+        return [
+            TensorLoader(images, labels, batch_size=32, shuffle=True, seed=i)
+            for i, (images, labels) in enumerate(partitions)
+        ]
+
+    net = Net()
+    start = time.perf_counter()
+    for trainloader in loaders():
+        set_weights(net, parameters)
+        train(net, trainloader, epochs, 0.01, "cpu")
+    sequential = time.perf_counter() - start
+
+    start = time.perf_counter()
+    train_stacked(Net(), parameters, loaders(), epochs, 0.01, "cpu")
+    stacked = time.perf_counter() - start
+
+    return {
+        "benchmark": "stacked_train",
+        "params": {"num_clients": num_clients, "num_examples": num_examples, "epochs": epochs},
+        "results": {
+            "sequential_s": sequential,
+            "stacked_s": stacked,
+            "speedup": sequential / stacked,
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num-clients", type=int, default=100)
+    parser.add_argument("--num-examples", type=int, default=480)
+    parser.add_argument("--epochs", type=int, default=1)
+    args = parser.parse_args()
+    print(json.dumps(run(args.num_clients, args.num_examples, args.epochs), indent=2))
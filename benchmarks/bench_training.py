@@ -0,0 +1,43 @@
+"""my-awesome-app: Throughput of local training and evaluation.
+
+Run from the root of the project with `python -m benchmarks.bench_training`.
+"""
+
+import argparse
+import json
+
+from app_research_project.server_app import EVAL_BATCH_SIZE
+from app_research_project.task import Net, TensorLoader, test, train
+from benchmarks.bench_loader import best_of, make_partition
+
+
+def run(num_examples: int = 6000, batch_size: int = 32, repeats: int = 3) -> dict:
+    """Examples per second of one epoch of `train` and of `test`.
+
+    `test` is timed with the batch size of the ClientApps and with the one the
+    ServerApp evaluates the global model with.
+    """
+    images, labels = make_partition(num_examples)
+    net = Net()
+    trainloader = TensorLoader(images, labels, batch_size=batch_size, shuffle=True, seed=0)
+    train_s = best_of(lambda: train(net, trainloader, 1, 0.01, "cpu"), repeats)
+    results = {"train_epoch_s": train_s, "train_samples_per_s": num_examples / train_s}
+    for name, size in (("client", batch_size), ("server", EVAL_BATCH_SIZE)):
+        testloader = TensorLoader(images, labels, batch_size=size)
+        test_s = best_of(lambda: test(net, testloader, "cpu"), repeats)
+        results[f"test_{name}_s"] = test_s
+        results[f"test_{name}_samples_per_s"] = num_examples / test_s
+    return {
+        "benchmark": "training",
+        "params": {"num_examples": num_examples, "batch_size": batch_size, "repeats": repeats},
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num-examples", type=int, default=6000)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    print(json.dumps(run(args.num_examples, args.batch_size, args.repeats), indent=2))
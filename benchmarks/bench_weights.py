@@ -0,0 +1,81 @@
+"""my-awesome-app: Parameter exchange with the flat buffer vs per-tensor state_dicts.
+
+Run from the root of the project with `python -m benchmarks.bench_weights`.
+"""
+
+import argparse
+import json
+import timeit
+from collections import OrderedDict
+
+import torch
+from flwr.common import ndarrays_to_parameters, parameters_to_ndarrays
+
+from app_research_project.task import Net, get_weights, set_weights, state_dict_from_weights
+
+
+def get_weights_state_dict(net):
+    """Previous `get_weights`: one array per tensor of the state_dict."""
+    return [val.cpu().numpy() for _, val in net.state_dict().items()]
+
+
+def set_weights_state_dict(net, parameters):
+    """Previous `set_weights`: rebuild a state_dict and load it."""
+    params_dict = zip(net.state_dict().keys(), parameters)
+    state_dict = OrderedDict({k: torch.from_numpy(v) for k, v in params_dict})
+    net.load_state_dict(state_dict, strict=True)
+
+
+def checkpoint_with_model(ndarrays):
+    """Previous checkpoint path of `CustomFedAvg.aggregate_fit`."""
+    model = Net()
+    set_weights_state_dict(model, ndarrays)
+    return model.state_dict()
+
+
+def run(number: int = 2000) -> dict:
+    """Average time (in microseconds) of each operation with both implementations."""
+    net = Net()
+    # Weights of another model, so `set_weights` doesn't copy the buffer onto itself
+    ndarrays = get_weights(Net())
+    parameters = ndarrays_to_parameters(ndarrays)
+    keys = list(net.state_dict().keys())
+    cases = {
+        "get_weights": (
+            lambda: get_weights_state_dict(net),
+            lambda: get_weights(net),
+        ),
+        "get_weights_no_copy": (
+            lambda: get_weights_state_dict(net),
+            lambda: get_weights(net, copy=False),
+        ),
+        "set_weights": (
+            lambda: set_weights_state_dict(net, ndarrays),
+            lambda: set_weights(net, ndarrays),
+        ),
+        "parameters_to_model": (
+            lambda: set_weights_state_dict(net, parameters_to_ndarrays(parameters)),
+            lambda: set_weights(net, parameters_to_ndarrays(parameters)),
+        ),
+        "checkpoint_state_dict": (
+            lambda: checkpoint_with_model(ndarrays),
+            lambda: state_dict_from_weights(keys, ndarrays),
+        ),
+    }
+    results = {}
+    for name, (current, flat) in cases.items():
+        current_us = timeit.timeit(current, number=number) / number * 1e6
+        flat_us = timeit.timeit(flat, number=number) / number * 1e6
+        results[name] = {"state_dict_us": current_us, "flat_us": flat_us, "speedup": current_us / flat_us}
+    return {
+        "benchmark": "weights",
+        "params": {"number": number, "num_parameters": net.flat_parameters.numel()},
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+    print(json.dumps(run(args.number), indent=2))
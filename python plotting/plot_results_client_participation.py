@@ -2,10 +2,13 @@ import os
 import pandas as pd
 import matplotlib.pyplot as plt
 
+from app_research_project.result_cache import ResultCache, round_rows
+
 # ----------------------
 # CONFIGURATION
 # ----------------------
-input_file = "results_clients_participation_rounds_20251030_003543.csv"
+sweep_name = "clients_participation"  # results cached by results_clients_participation.py
+input_file = "results_clients_participation_rounds_20251030_003543.csv"  # fallback without a cache
 output_dir = "plots_clients_participation"
 os.makedirs(output_dir, exist_ok=True)
 
@@ -20,7 +23,8 @@ fraction_styles = {
 # ----------------------
 # LOAD DATA
 # ----------------------
-data = pd.read_csv(input_file)
+results = ResultCache().load_sweep(sweep_name)
+data = pd.DataFrame(round_rows(results)) if results else pd.read_csv(input_file)
 print("✅ Data loaded:", data.shape)
 print("Unique num_clients:", data["num_clients"].unique())
 print("Unique fraction_fit:", data["fraction_fit"].unique())
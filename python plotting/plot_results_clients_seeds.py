@@ -3,10 +3,13 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import os
 
+from app_research_project.result_cache import ResultCache, round_rows, summary_rows
+
 # ----------------------
 # CONFIG
 # ----------------------
-summary_csv = "results_clients_seeds_summary_10.0.csv"
+sweep_name = "clients_seeds"  # results cached by results_clients_seeds.py
+summary_csv = "results_clients_seeds_summary_10.0.csv"  # fallback without a cache
 rounds_csv = "results_clients_seeds_rounds_10.0.csv"
 output_dir = "plots_alpha10.0"
 
@@ -15,8 +18,13 @@ os.makedirs(output_dir, exist_ok=True)
 # ----------------------
 # LOAD DATA
 # ----------------------
-df_summary = pd.read_csv(summary_csv)
-df_rounds = pd.read_csv(rounds_csv)
+results = ResultCache().load_sweep(sweep_name)
+if results:
+    df_summary = pd.DataFrame(summary_rows(results))
+    df_rounds = pd.DataFrame(round_rows(results))
+else:
+    df_summary = pd.read_csv(summary_csv)
+    df_rounds = pd.read_csv(rounds_csv)
 
 # Filter only successful runs
 df_summary = df_summary[df_summary["status"] == "ok"]
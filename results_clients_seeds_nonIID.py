@@ -1,7 +1,9 @@
-import subprocess
-import re
 import csv
-from datetime import datetime
+
+from app_research_project.data_store import class_counts
+from app_research_project.partitioning import Partitioning
+from app_research_project.result_cache import ResultCache
+from app_research_project.sweep import SweepCell, grid, run_sweep
 
 # ----------------------
 # CONFIGURATION
@@ -12,157 +14,104 @@ num_server_rounds = 10
 output_csv_summary = "results_clients_seeds_summary_NonIID.csv"
 output_csv_rounds = "results_clients_seeds_rounds_NonIID.csv"
 output_csv_classes = "results_clients_classes_NonIID.csv"
-flwr_executable = "flwr"
-
-# ----------------------
-# Regex helpers
-# ----------------------
-re_cen_acc_block = re.compile(r"cen_accuracy['\"]?\s*:\s*\[(.*?)\]", re.S)
-re_acc_points = re.compile(r"\(\s*(\d+)\s*,\s*([0-9]*\.?[0-9]+)\s*\)")
-re_round_loss = re.compile(r"round\s+(\d+)\s*:\s*([0-9]*\.?[0-9]+)")
-re_client_classes = re.compile(r"Client\s+(\d+)\s+has\s+classes:\s*(\[.*?\])\s*\(counts=(\{.*?\})\)")
-
-# ----------------------
-# Storage
-# ----------------------
-summary_results = []
-round_results = []
-class_distributions = []
+max_workers = None                  # parallel simulations (None = sized from the CPUs, at most 4)
+timeout = 1800                      # seconds before a simulation is killed
+retries = 1                         # re-runs of a failed or timed out simulation
 
 # ----------------------
-# Main experiment loop
+# Sweep cells
 # ----------------------
-for num_clients in client_counts:
-    for seed in seeds:
-        print(f"\n🚀 Running experiment with {num_clients} clients | seed={seed} ...")
-
-        cmd = [
-            flwr_executable, "run", ".",
-            "--federation-config",
-            f'{{"federation": "local-simulation", "options.num-supernodes": {num_clients}}}',
-            "--run-config",
-            f'{{"num-server-rounds": {num_server_rounds}, "seed": {seed}}}',
-        ]
-
-        try:
-            proc = subprocess.run(cmd, capture_output=True, text=True)
-        except subprocess.TimeoutExpired:
-            print(f"⏰ Run timed out for {num_clients} clients | seed={seed}.")
-            summary_results.append({
-                "timestamp": datetime.now().isoformat(),
-                "num_clients": num_clients,
-                "seed": seed,
-                "num_rounds": num_server_rounds,
-                "status": "timeout",
-                "final_accuracy": None,
-                "final_loss": None,
-                "error": "timeout"
-            })
-            continue
-
-        output = (proc.stdout or "") + "\n" + (proc.stderr or "")
-
-        # Save raw log
-        log_filename = f"flwr_run_{num_clients}_clients_seed_{seed}.log"
-        with open(log_filename, "w", encoding="utf-8") as f:
-            f.write(output)
-
-        # ---- Extract client class info ----
-        for match in re_client_classes.findall(output):
-            client_id, class_list, class_counts = match
-            class_distributions.append({
-                "num_clients": num_clients,
-                "seed": seed,
-                "client_id": int(client_id),
-                "classes": class_list,
-                "counts": class_counts
-            })
-
-        # ---- Handle failed runs ----
-        if proc.returncode != 0:
-            err_summary = proc.stderr.strip()[:500] or proc.stdout.strip()[:500]
-            print(f"❗ flwr failed for {num_clients} clients | seed={seed}.")
-            summary_results.append({
-                "timestamp": datetime.now().isoformat(),
-                "num_clients": num_clients,
-                "seed": seed,
-                "num_rounds": num_server_rounds,
-                "status": "failed",
-                "final_accuracy": None,
-                "final_loss": None,
-                "error": err_summary,
-            })
-            continue
-
-        # ---- Parse per-round accuracies ----
-        round_accs = []
-        m = re_cen_acc_block.search(output)
-        if m:
-            block = m.group(1)
-            for r, val in re_acc_points.findall(block):
-                round_accs.append((int(r), float(val)))
-
-        # ---- Parse per-round losses ----
-        round_losses = []
-        for r, val in re_round_loss.findall(output):
-            round_losses.append((int(r), float(val)))
-
-        # ---- Combine metrics ----
-        round_map = {}
-        for r, acc in round_accs:
-            round_map.setdefault(r, {})["accuracy"] = acc
-        for r, loss in round_losses:
-            round_map.setdefault(r, {})["loss"] = loss
-
-        for r, vals in sorted(round_map.items()):
-            round_results.append({
-                "num_clients": num_clients,
-                "seed": seed,
-                "round": r,
-                "accuracy": vals.get("accuracy"),
-                "loss": vals.get("loss"),
-            })
-
-        final_acc = round_accs[-1][1] if round_accs else None
-        final_loss = round_losses[-1][1] if round_losses else None
-        print(f"✅ Finished {num_clients} clients | seed={seed}: acc={final_acc}, loss={final_loss}")
+cells = [
+    SweepCell(
+        run_config={"num-server-rounds": num_server_rounds, "seed": p["seed"]},
+        num_supernodes=p["num_clients"],
+        tags=p,
+    )
+    for p in grid(num_clients=client_counts, seed=seeds)
+]
+
+
+def report(result):
+    """Print the outcome of a finished cell."""
+    num_clients, seed = result.cell.tags["num_clients"], result.cell.tags["seed"]
+    if result.status == "ok":
+        print(f"✅ Finished {num_clients} clients | seed={seed}: "
+              f"acc={result.final_accuracy}, loss={result.final_loss}")
+    elif result.status == "timeout":
+        print(f"⏰ Run timed out for {num_clients} clients | seed={seed}.")
+    else:
+        print(f"❗ Simulation failed for {num_clients} clients | seed={seed}.")
+
+
+if __name__ == "__main__":
+    # ----------------------
+    # Main experiment loop
+    # ----------------------
+    print(f"\n🚀 Running {len(cells)} experiments ...")
+    # Finished cells are cached under a key, re-running the script skips them
+    cache = ResultCache()
+    cache.save_sweep("clients_seeds_nonIID", cells)
+    results = run_sweep(cells, on_result=report, max_workers=max_workers, timeout=timeout, retries=retries, cache=cache)
+
+    # ----------------------
+    # Storage (in cell order)
+    # ----------------------
+    summary_results = []
+    round_results = []
+    class_distributions = []
+    for result in results:
+        num_clients, seed = result.cell.tags["num_clients"], result.cell.tags["seed"]
+        for row in result.round_rows():
+            round_results.append({"num_clients": num_clients, "seed": seed, **row})
 
         summary_results.append({
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": result.finished_at,
             "num_clients": num_clients,
             "seed": seed,
             "num_rounds": num_server_rounds,
-            "status": "ok",
-            "final_accuracy": final_acc,
-            "final_loss": final_loss,
-            "error": None,
+            "status": result.status,
+            "final_accuracy": result.final_accuracy,
+            "final_loss": result.final_loss,
+            "error": result.error,
         })
 
-# ----------------------
-# Write CSVs
-# ----------------------
-with open(output_csv_summary, "w", newline="", encoding="utf-8") as f:
-    writer = csv.DictWriter(f, fieldnames=[
-        "timestamp", "num_clients", "seed", "num_rounds",
-        "status", "final_accuracy", "final_loss", "error"
-    ])
-    writer.writeheader()
-    writer.writerows(summary_results)
-
-with open(output_csv_rounds, "w", newline="", encoding="utf-8") as f:
-    writer = csv.DictWriter(f, fieldnames=[
-        "num_clients", "seed", "round", "accuracy", "loss"
-    ])
-    writer.writeheader()
-    writer.writerows(round_results)
-
-with open(output_csv_classes, "w", newline="", encoding="utf-8") as f:
-    writer = csv.DictWriter(f, fieldnames=[
-        "num_clients", "seed", "client_id", "classes", "counts"
-    ])
-    writer.writeheader()
-    writer.writerows(class_distributions)
+        # Classes each client holds, read from the partition index (no logs to parse)
+        partitioning = Partitioning(seed=seed)
+        for client_id, counts in enumerate(class_counts(num_clients, partitioning)):
+            class_distributions.append({
+                "num_clients": num_clients,
+                "seed": seed,
+                "client_id": client_id,
+                "classes": [label for label, count in enumerate(counts) if count],
+                "counts": {label: int(count) for label, count in enumerate(counts) if count},
+            })
 
-print(f"\n📊 Summary saved to {output_csv_summary}")
-print(f"📈 Per-round metrics saved to {output_csv_rounds}")
-print(f"🧩 Class distributions saved to {output_csv_classes}")
+    # ----------------------
+    # Write CSVs
+    # ----------------------
+    with open(output_csv_summary, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=[
+            "timestamp", "num_clients", "seed", "num_rounds",
+            "status", "final_accuracy", "final_loss", "error"
+        ])
+        writer.writeheader()
+        writer.writerows(summary_results)
+
+    with open(output_csv_rounds, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=[
+            "num_clients", "seed", "round", "accuracy", "loss",
+            "bytes_up", "bytes_down", "round_time", "dropped"
+        ])
+        writer.writeheader()
+        writer.writerows(round_results)
+
+    with open(output_csv_classes, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=[
+            "num_clients", "seed", "client_id", "classes", "counts"
+        ])
+        writer.writeheader()
+        writer.writerows(class_distributions)
+
+    print(f"\n📊 Summary saved to {output_csv_summary}")
+    print(f"📈 Per-round metrics saved to {output_csv_rounds}")
+    print(f"🧩 Class distributions saved to {output_csv_classes}")